@@ -117,22 +117,20 @@ class Element(object):
         else:
             result.append(u"<%s>" % (self.name))
 	for c in self.content:
-	    try:
-                result.append(c.__unicode__(indent+perlevel, perlevel))
-	    except:
-                if isinstance(c, str):
-                    result.append(unicode(c, ENCODING))
-                elif isinstance(c, unicode):
-                    result.append(c)
-                else:
-                    result.append(unicode(c))
+            result.append(render(c, indent+perlevel, perlevel))
         if self.allow_content:
             result.append(u"</%s>" % self.name)
 	return u''.join(result)
 
-    def update(self, d): 
+    def update(self, d):
+        attrlist = self.attrlist
+        attrs = self.dict
 	for k, v in d.iteritems():
-            self[k] = v
+            kl = k.lower()
+            if kl in attrlist:
+                attrs[kl] = v
+            else:
+                self[k] = v             # Raises KeyError
 
     def append(self, *items):
         if self.allow_content:
@@ -141,6 +139,22 @@ class Element(object):
 	    raise TypeError('No content for this element')
 
 
+def render(content, indent=0, perlevel=2):
+    """Return the unicode for an item of the content of an element.
+    An element is rendered at the given indent.
+    """
+    if isinstance(content, str):
+        return unicode(content, ENCODING)
+    elif isinstance(content, unicode):
+        return content
+    elif isinstance(content, Element):
+        return content.__unicode__(indent, perlevel)
+    try:
+        return content.__unicode__(indent, perlevel)
+    except (AttributeError, TypeError):
+        return unicode(content)
+
+
 class CommonElement(Element):
     attrlist = common_attrs
 
@@ -3,18 +3,28 @@
 Application class: WSGI interface.
 """
 
+import os
 import logging
 import re
 import inspect
+import threading
 import urlparse
 import traceback
+import time
+import tempfile
+import cgi
+import cProfile
+import pstats
+import cStringIO
 import wsgiref.util
 import wsgiref.headers
-import json
 
 from .request import *
 from .responses import *
-from .utils import HTTP_METHODS, url_build
+from .utils import HTTP_METHODS, url_build, LruCache, timer
+from .router import LinearRouter, RegexRouter, TrieRouter
+from . import compression
+from . import jsoncodec
 
 
 class Application(object):
@@ -23,6 +33,42 @@ class Application(object):
 
     The web server must be configured to call an instance of
     this class for all HTTP requests to the relevant URLs.
+
+    The router class determines how the resource for a URL path is found.
+    LinearRouter tries each resource in turn; RegexRouter uses a single
+    combined regexp; TrieRouter is the fastest when there are many
+    resources. The first matching resource, in the order of definition,
+    is used in all cases.
+
+    If 'route_cache_size' is non-zero, then the resource and variables
+    found for a URL path are kept in a bounded LRU cache of that size.
+    URL paths not found are also cached.
+
+    The time taken by each phase of a request is recorded, and passed
+    to the method 'report_timings'. If 'server_timing' is True, then
+    the timings are also given in the 'Server-Timing' response header.
+
+    If 'metrics' is a wrapid.metrics.Metrics instance, then the count,
+    status code and latency of each request is recorded in it.
+
+    If 'response_cache' is a wrapid.cache.ResponseCache instance, then
+    GET method classes using wrapid.cache.ResponseCacheMixin will store
+    their responses in it, and serve them from it.
+
+    If 'compression' is True, then response bodies are compressed using
+    gzip or deflate, if accepted by the client. Bodies smaller than
+    'compression_min_size', and already compressed mimetypes, are not.
+
+    If 'max_body_size' is not None, then request input larger than that
+    number of bytes is rejected with HTTP_REQUEST_ENTITY_TOO_LARGE.
+    A resource may define its own limit, which then applies instead.
+
+    An instance is safe to use from several threads concurrently, e.g.
+    by mod_wsgi with 'threads' larger than 1. No per-request state is
+    stored in the instance; the application URL and path for a request
+    are the attributes 'application_url' and 'application_path' of the
+    Request instance. The 'url' and 'path' properties of the instance
+    give those of the request currently being handled in the calling thread.
     """
 
     # Default values used if none are provided at instantiation.
@@ -32,93 +78,306 @@ class Application(object):
                    admin='Administrator',
                    email='admin@localhost.xyz')
     debug   = False
+    router  = LinearRouter              # Class; instantiated for the instance
+    route_cache_size = 0                # No cache of URL path lookups
+    server_timing = False               # Output 'Server-Timing' header?
+    metrics = None                      # Metrics instance, if any
+    response_cache = None               # cache.ResponseCache instance, if any
+    compression = False                 # Compress response bodies?
+    compression_min_size = 1024         # Bytes; smaller bodies not compressed
+    compression_level = 6
+    max_body_size = None                # Bytes; no limit by default
 
-    def __init__(self, name=None, version=None, host=None, debug=None):
+    # Profiling of a single request; only when in debug mode.
+    profile_query   = 'profile'
+    profile_header  = 'X-Wrapid-Profile'
+    profile_dirpath = None              # Directory to write profile data to
+    profile_sort    = 'cumulative'
+    profile_limit   = 60                # Number of functions in statistics
+
+    # Max number of application URLs cached, one per host and script name.
+    URL_CACHE_SIZE = 256
+
+    def __init__(self, name=None, version=None, host=None, debug=None,
+                 router=None, route_cache_size=None, server_timing=None,
+                 metrics=None, response_cache=None, compression=None,
+                 max_body_size=None):
         self.name = name or self.__class__.__name__
         self.version = version or self.version
         self.host = host or self.host
         self.debug = debug or self.debug
+        self.router = (router or self.router)()
+        self.route_cache_size = route_cache_size or self.route_cache_size
+        if self.route_cache_size:
+            self.route_cache = LruCache(self.route_cache_size)
+        else:
+            self.route_cache = None
+        self.server_timing = server_timing or self.server_timing
+        self.metrics = metrics or self.metrics
+        if response_cache is not None: # May be empty, i.e. False
+            self.response_cache = response_cache
+        self.compression = compression or self.compression
+        self.max_body_size = max_body_size or self.max_body_size
         self.resources = []
-        self.url = None
+        self.url_cache = LruCache(self.URL_CACHE_SIZE)
+        self.local = threading.local()
+
+    @property
+    def url(self):
+        "The application URL for the request being handled in this thread."
+        request = getattr(self.local, 'request', None)
+        return request and request.application_url
+
+    @property
+    def path(self):
+        "The application path for the request being handled in this thread."
+        request = getattr(self.local, 'request', None)
+        return request and request.application_path
 
     def __call__(self, environ, start_response):
         "WSGI interface; this method is called for each HTTP request."
-        self.url = wsgiref.util.application_uri(environ)
-        logging.debug("wrapid. Application URL %s", self.url)
-        self.path = urlparse.urlparse(self.url).path
-        logging.debug("wrapid: Application path %s", self.path)
+        if self.debug and self.is_profile_requested(environ):
+            return self.profile(environ, start_response)
+        return self.handle(environ, start_response)
+
+    def handle(self, environ, start_response):
+        "Handle the request given by the WSGI environment."
+        request = self.get_request(environ)
+        previous = getattr(self.local, 'request', None) # If sub-request
+        self.local.request = request
+        try:
+            return self.dispatch(request, start_response)
+        finally:
+            self.local.request = previous
+            request.close()
+
+    def get_request(self, environ):
+        "Return the Request instance for the WSGI environment."
+        url, path = self.get_application_url(environ)
+        logging.debug("wrapid. Application URL %s", url)
+        logging.debug("wrapid: Application path %s", path)
         request = Request(environ)
         request.application = self
-        logging.debug("wrapid: HTTP method '%s', URL path '%s'",
-                      request.http_method,
-                      request.urlpath)
-        try:
-            for resource in self.resources:
-                match = resource.match(request.urlpath)
-                if match:
-                    request.name = resource.name
-                    request.variables.update(match.groupdict())
-                    break
-            else:
-                raise HTTP_NOT_FOUND
-            request.remove_format_url()
+        request.application_url = url
+        request.application_path = path
+        return request
+
+    def is_profile_requested(self, environ):
+        "Does the request ask to be profiled?"
+        header = 'HTTP_' + self.profile_header.upper().replace('-', '_')
+        if environ.get(header):
+            return True
+        query = cgi.parse_qs(environ.get('QUERY_STRING', ''),
+                             keep_blank_values=True)
+        return self.profile_query in query
+
+    def profile(self, environ, start_response):
+        """Handle the request under cProfile, including producing
+        the body of the response.
+        """
+        output = dict()
+        def capture(status, headers, exc_info=None):
+            output['status'] = status
+            output['headers'] = headers
+            return output.setdefault('body', []).append
+        def run():
+            result = self.handle(environ, capture)
             try:
-                method = resource.methods[request.http_method]
-            except KeyError:
-                allow = ','.join(resource.methods.keys())
-                if request.http_method == 'OPTIONS':
-                    return HTTP_NO_CONTENT(Allow=allow)
-                else:
-                    raise HTTP_METHOD_NOT_ALLOWED(Allow=allow)
+                output.setdefault('body', []).extend(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        profiler = cProfile.Profile()
+        profiler.runcall(run)
+        if self.profile_dirpath:
+            prefix = "%s%s-" % (time.strftime('%Y%m%d-%H%M%S'),
+                                re.sub(r'\W+', '-',
+                                       environ.get('PATH_INFO', '')))
+            fd, filepath = tempfile.mkstemp(prefix=prefix,
+                                            suffix='.prof',
+                                            dir=self.profile_dirpath)
+            os.close(fd)
+            profiler.dump_stats(filepath)
+            logging.info("wrapid: profile data written to %s", filepath)
+            start_response(output['status'], output['headers'])
+            return output['body']
+        stream = cStringIO.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats(self.profile_sort).print_stats(self.profile_limit)
+        response = HTTP_OK(content_type='text/plain')
+        response.append("%s %s: %s\n\n" % (environ.get('REQUEST_METHOD'),
+                                            environ.get('PATH_INFO'),
+                                            output['status']))
+        response.append(stream.getvalue())
+        return response(start_response)
+
+    def get_application_url(self, environ):
+        """Return the tuple (URL, path) for the application.
+        These depend only on the scheme, host and script name,
+        so they are cached.
+        """
+        key = (environ.get('wsgi.url_scheme'),
+               environ.get('HTTP_HOST'),
+               environ.get('SERVER_NAME'),
+               environ.get('SERVER_PORT'),
+               environ.get('SCRIPT_NAME'))
+        try:
+            return self.url_cache[key]
+        except KeyError:
+            url = wsgiref.util.application_uri(environ)
+            result = (url, urlparse.urlparse(url).path)
+            self.url_cache[key] = result
+            return result
+
+    def dispatch(self, request, start_response):
+        """Find the resource and HTTP method handler for the request,
+        and return the response from it.
+        """
+        try:
+            method = self.get_method(request)
             try:
-                self.prepare(request)
+                with request.timing('app_prepare'):
+                    self.prepare(request)
                 if inspect.isfunction(method):
-                    response = method(request)
+                    with request.timing('handler'):
+                        response = method(request)
                 elif inspect.isclass(method):
                     response = method().respond(request)
                 else:
                     raise ValueError('invalid HTTP request method handler')
-                # Shortcut: If dict, then return as JSON representation
-                if isinstance(response, dict):
-                    data = json.dumps(response, indent=2)
-                    response = HTTP_OK(content_type='application/json; charset=utf-8')
-                    response.append(data)
-                # Shortcut: If string, then either HTML or plain text
-                elif isinstance(response, str):
-                    data = response
-                    # If first char '<', then HTML
-                    if data[0] == '<':
-                        response = HTTP_OK(content_type='text/html')
-                    # If first char not '<', then plain text
-                    else:
-                        response = HTTP_OK(content_type='text/plain')
-                    response.append(data)
-                return response(start_response)
+                response = self.get_shortcut_response(request, response)
             finally:
-                self.finalize(request)
-        except HTTP_UNAUTHORIZED, error: # Do not log, nor give browser output
-            logging.debug("wrapid: HTTP %s", error)
-            return error(start_response)
-        except HTTP_REDIRECTION, error:
-            logging.debug("wrapid: HTTP %s", error)
-            return error(start_response)
-        except HTTP_ERROR, error:
-            logging.debug("wrapid: HTTP %s", error)
-            if request.human_user_agent:
-                response = HTTP_OK(content_type='text/plain')
-                response.append("%s\n\n%s" % (error, ''.join(error.content)))
-                return response(start_response)
+                with request.timing('app_finalize'):
+                    self.finalize(request)
+        except Response, error:
+            response = self.get_error_response(request, error)
+        except Exception:
+            response = self.get_exception_response()
+        return self.finish(request, response, start_response)
+
+    def get_method(self, request):
+        """Find the resource for the request, set the variables from
+        its URL path, find the HTTP method handler, read the input
+        only then, and return the handler.
+        Raise HTTP_NOT_FOUND or HTTP_METHOD_NOT_ALLOWED if none.
+        Raise HTTP_NO_CONTENT for OPTIONS if there is no handler for it.
+        """
+        logging.debug("wrapid: HTTP method '%s', URL path '%s'",
+                      request.http_method,
+                      request.urlpath)
+        found = self.lookup(request.urlpath)
+        if found is None:
+            raise HTTP_NOT_FOUND
+        resource, variables = found
+        request.name = resource.name
+        request.variables.update(variables)
+        request.remove_format_url()
+        if resource.max_body_size is not None:
+            request.max_body_size = resource.max_body_size
+        else:
+            request.max_body_size = self.max_body_size
+        try:
+            method = resource.methods[request.http_method]
+        except KeyError:
+            allow = ','.join(resource.methods.keys())
+            if request.http_method == 'OPTIONS':
+                raise HTTP_NO_CONTENT(Allow=allow)
+            else:
+                raise HTTP_METHOD_NOT_ALLOWED(Allow=allow)
+        request.handle_input()
+        return method
+
+    def get_shortcut_response(self, request, response):
+        """Return the response for the value returned by a handler.
+        A dictionary becomes a JSON representation; indented if the
+        user agent is a browser, else compact. A string becomes
+        HTML if its first character is '<', otherwise plain text.
+        Anything else is returned as is.
+        """
+        if isinstance(response, dict):
+            data = jsoncodec.dumps(response,
+                                   indent=request.human_user_agent and 2)
+            response = HTTP_OK(content_type='application/json; charset=utf-8')
+            response.append(data)
+        elif isinstance(response, str):
+            data = response
+            if data[0] == '<':
+                response = HTTP_OK(content_type='text/html')
             else:
-                return error(start_response)
-        except Exception, message:
-            tb = traceback.format_exc(limit=20)
-            logging.error("wrapid: Exception\n%s", tb)
-            error = HTTP_INTERNAL_SERVER_ERROR(content_type='text/plain')
-            error.append("%s\n" % error)
-            if self.debug:
-                error.append('\n')
-                error.append(tb)
-            return error(start_response)
+                response = HTTP_OK(content_type='text/plain')
+            response.append(data)
+        return response
+
+    def get_error_response(self, request, error):
+        """Return the response for the given raised response instance.
+        Except for HTTP_UNAUTHORIZED, an HTTP error is output as plain text
+        if the user agent is a browser.
+        """
+        logging.debug("wrapid: HTTP %s", error)
+        if isinstance(error, HTTP_ERROR) and \
+           not isinstance(error, HTTP_UNAUTHORIZED) and \
+           request.human_user_agent:
+            response = HTTP_OK(content_type='text/plain')
+            response.append("%s\n\n%s" % (error, ''.join(error.content)))
+            return response
+        return error
+
+    def get_exception_response(self):
+        "Return the response for the exception currently being handled."
+        tb = traceback.format_exc(limit=20)
+        logging.error("wrapid: Exception\n%s", tb)
+        error = HTTP_INTERNAL_SERVER_ERROR(content_type='text/plain')
+        error.append("%s\n" % error)
+        if self.debug:
+            error.append('\n')
+            error.append(tb)
+        return error
+
+    def finish(self, request, response, start_response):
+        """Record the total time for the request, and the metrics if enabled.
+        Report the timings, and start the response. Compress the body
+        if enabled, and accepted by the client.
+        """
+        total = timer() - request.time_start
+        request.timings.append(('total', total))
+        if self.metrics is not None:
+            self.metrics.record(request.name,
+                                request.http_method,
+                                response.http_code,
+                                total)
+        self.report_timings(request, response)
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join(["%s;dur=%.3f" % (n, 1000*t)
+                                                   for n, t in request.timings])
+        if self.compression and \
+           compression.is_compressible(response, self.compression_min_size):
+            compression.set_vary(response)
+            encoding = compression.get_encoding(
+                request.environ.get('HTTP_ACCEPT_ENCODING'))
+            if encoding:
+                compression.set_headers(response, encoding)
+                return compression.CompressedBody(
+                    response(start_response),
+                    encoding,
+                    level=self.compression_level,
+                    flush=not response.buffered)
+        elif self.compression and response.http_code == 304:
+            compression.set_vary(response)
+            compression.set_not_modified_etag(
+                response,
+                compression.get_encoding(
+                    request.environ.get('HTTP_ACCEPT_ENCODING')),
+                request.environ.get('HTTP_IF_NONE_MATCH'))
+        return response(start_response)
+
+    def report_timings(self, request, response):
+        """Application-wide handling of the timings of the phases of
+        the request, e.g. logging. The list of tuples (name, seconds)
+        is in the attribute 'timings' of the request. The total time
+        does not include producing the body of a streamed response.
+        No action by default.
+        """
+        pass
 
     def prepare(self, request):
         """Application-wide preparatory actions, e.g. database connect.
@@ -132,19 +391,43 @@ class Application(object):
         """
         pass
 
-    def add_resource(self, url_template, name=None, descr=None, **methods):
-        "Define the HTTP method handlers for the given URL template."
-        self.resources.append(Resource(url_template,
-                                       name=name,
-                                       descr=descr,
-                                       **methods))
+    def add_resource(self, url_template, name=None, descr=None,
+                     max_body_size=None, **methods):
+        """Define the HTTP method handlers for the given URL template.
+        If 'max_body_size' is given, then it is the limit for the size
+        of the request input for the resource, instead of that of
+        the application.
+        """
+        resource = Resource(url_template, name=name, descr=descr,
+                            max_body_size=max_body_size, **methods)
+        self.resources.append(resource)
+        self.router.add(resource)
+        if self.route_cache is not None:
+            self.route_cache.clear()
+
+    def lookup(self, urlpath):
+        """Return the tuple (resource, variables) for the URL path,
+        or None if no resource matches it.
+        Use the route cache, if enabled. The variables dictionary
+        must not be modified by the caller.
+        """
+        if self.route_cache is None:
+            return self.router.match(urlpath)
+        try:
+            return self.route_cache[urlpath]
+        except KeyError:
+            found = self.router.match(urlpath)
+            self.route_cache[urlpath] = found
+            return found
 
     def get_url(self, *segments, **query):
         """Synthesize an absolute URL from the application URL
         and the given path segments and query.
+        Uses the application URL for the request being handled in this thread.
         """
-        assert self.url
-        segments = [self.url] + list(segments)
+        url = self.url
+        assert url
+        segments = [url] + list(segments)
         return url_build(*segments, **query)
 
 
@@ -155,18 +438,20 @@ class Resource(object):
 
     VARIABLE_RX = re.compile(r'\{([^/\}]+)\}')
 
-    def __init__(self, urlpath_template, name=None, descr=None, **methods):
+    def __init__(self, urlpath_template, name=None, descr=None,
+                 max_body_size=None, **methods):
         self.urlpath_template = urlpath_template
         if urlpath_template in ['', '/']: # Special cases
             pattern = '/?'
         else:
             pattern = urlpath_template
         pattern = self.VARIABLE_RX.sub(self.replace_variable, pattern)
-        pattern += r'(?P<FORMAT>\.\w{1,4})?'
+        pattern += r'(?P<FORMAT>\.\w{1,6})?'
         pattern = "^%s$" % pattern
         self.urlpath_rx = re.compile(pattern)
         self.name = name
         self._descr = descr
+        self.max_body_size = max_body_size
         self.methods = dict()
         for key, method in methods.items():
             if key not in HTTP_METHODS:
@@ -0,0 +1,458 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+Application class for asynchronous handlers, and an HTTP/1.1 server
+running it on an asyncio event loop, so that requests waiting on
+databases or upstream services do not each tie up a thread.
+
+Requires trollius, the asyncio package for Python 2. Coroutines are
+written in its style, as generators yielding From(...) and returning
+the value by raising Return(...).
+
+A handler function may be a coroutine function. A method class may
+inherit from AsyncMethod, or from one of the classes AsyncGET, AsyncPOST,
+etc, and then 'prepare', 'process', 'get_version', 'get_data',
+'get_data_resource' and 'finalize' may be coroutine functions, or plain
+functions.
+Ordinary handler functions and method classes are also allowed; they
+are called synchronously, and must not block. Routing by Resource, and
+raising Response instances, work as for Application.
+
+    application = AsyncApplication()
+    application.add_resource('/item/{id}', name='Item', GET=GET_Item)
+    serve(application, port=8080)
+
+An AsyncApplication instance is also a WSGI application; each request
+is then run to completion on an event loop owned by the calling thread.
+Since many requests are interleaved on the event loop, the thread-local
+'url' and 'path' properties of the application are not defined while
+handling a request asynchronously; use those of the request instead.
+"""
+
+import logging
+import inspect
+import cStringIO
+import urllib
+import email.utils
+
+import trollius as asyncio
+from trollius import From, Return
+
+from .application import *
+from .methods import *
+
+
+@asyncio.coroutine
+def resolve(result):
+    """Coroutine returning the result of a function which may be
+    a coroutine function, or a plain one.
+    """
+    if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+        result = yield From(result)
+    raise Return(result)
+
+
+class AsyncApplication(Application):
+    """Application allowing handler functions and method classes
+    to be coroutines. Use 'serve' to run it on an event loop.
+    The methods 'prepare' and 'finalize' may also be coroutine functions.
+    """
+
+    @asyncio.coroutine
+    def handle_async(self, environ):
+        """Handle the request given by the WSGI-style environment.
+        Return the tuple (request, response).
+        """
+        request = self.get_request(environ)
+        try:
+            response = yield From(self.dispatch_async(request))
+        finally:
+            request.close()
+        raise Return((request, response))
+
+    def dispatch(self, request, start_response):
+        "Run the request to completion on the event loop of this thread."
+        try:
+            loop = self.local.loop
+        except AttributeError:
+            loop = self.local.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop) # Default for coroutines called
+        response = loop.run_until_complete(self.dispatch_async(request))
+        return self.finish(request, response, start_response)
+
+    @asyncio.coroutine
+    def dispatch_async(self, request):
+        """Find the resource and HTTP method handler for the request,
+        and return the response from it; not yet started.
+        """
+        try:
+            method = self.get_method(request)
+            try:
+                with request.timing('app_prepare'):
+                    yield From(resolve(self.prepare(request)))
+                if inspect.isfunction(method):
+                    with request.timing('handler'):
+                        response = yield From(resolve(method(request)))
+                elif inspect.isclass(method):
+                    response = yield From(resolve(method().respond(request)))
+                else:
+                    raise ValueError('invalid HTTP request method handler')
+                response = self.get_shortcut_response(request, response)
+            finally:
+                with request.timing('app_finalize'):
+                    yield From(resolve(self.finalize(request)))
+        except Response, error:
+            response = self.get_error_response(request, error)
+        except Exception:
+            response = self.get_exception_response()
+        raise Return(response)
+
+
+class AsyncMethod(Method):
+    """Abstract base class for handling a HTTP request method,
+    where the methods 'prepare', 'process', 'get_response'
+    and 'finalize' may be coroutine functions.
+    """
+
+    @asyncio.coroutine
+    def respond(self, request):
+        """Handle the request and return a response instance.
+        Raise an HTTP error if there is a problem.
+        Any other exception is considered a server failure.
+        """
+        with request.timing('prepare'):
+            yield From(resolve(self.prepare(request)))
+        try:
+            if request.http_method not in SAFE_METHODS:
+                yield From(self.check_if_none_match(request))
+            with request.timing('process'):
+                yield From(resolve(self.process(request)))
+            response = yield From(resolve(self.get_response(request)))
+        finally:
+            with request.timing('finalize'):
+                yield From(resolve(self.finalize()))
+        raise Return(response)
+
+    @asyncio.coroutine
+    def check_if_none_match(self, request):
+        "See Method; 'get_etag' may be a coroutine function."
+        if_none_match = request.headers['If-None-Match']
+        if not if_none_match: return
+        etag = yield From(resolve(self.get_etag(request)))
+        if etag_matches(if_none_match, etag):
+            raise HTTP_PRECONDITION_FAILED
+
+
+class AsyncOutreprsMethodMixin(OutreprsMethodMixin):
+    """Mixin class providing outgoing representation functions,
+    where 'get_version' and 'get_data_resource' may be coroutine functions.
+    """
+
+    @asyncio.coroutine
+    def get_response(self, request):
+        "Return the response instance; see OutreprsMethodMixin."
+        safe = request.http_method in SAFE_METHODS
+        if safe:
+            version = yield From(resolve(self.get_version(request)))
+        else:
+            version = None
+        if version is None:
+            with request.timing('data'):
+                data = yield From(resolve(self.get_data(request)))
+            with request.timing('outrepr'):
+                outrepr = self.get_outrepr(request)
+            with request.timing('representation'):
+                response = outrepr(data)
+            if self.etag and safe:
+                self.check_etag(request, self.set_etag_body(response))
+        else:
+            with request.timing('outrepr'):
+                outrepr = self.get_outrepr(request)
+            etag = self.get_version_etag(version, outrepr)
+            self.check_etag(request, etag)
+            with request.timing('data'):
+                data = yield From(resolve(self.get_data(request)))
+            with request.timing('representation'):
+                response = outrepr(data)
+            response['ETag'] = etag
+        raise Return(response)
+
+    @asyncio.coroutine
+    def get_etag(self, request):
+        "See OutreprsMethodMixin; 'get_version' may be a coroutine function."
+        version = yield From(resolve(self.get_version(request)))
+        if version is None: raise Return(None)
+        raise Return(self.get_version_etag(version, self.get_outrepr(request)))
+
+    @asyncio.coroutine
+    def get_data(self, request):
+        "Return the response data dictionary."
+        data                  = self.get_data_general(request)
+        data['links']         = self.get_data_links(request)
+        data['documentation'] = self.get_data_documentation(request)
+        data['operations']    = self.get_data_operations(request)
+        data['outreprs']      = self.get_data_outreprs(request)
+        resource = yield From(resolve(self.get_data_resource(request)))
+        data.update(resource)
+        raise Return(data)
+
+
+class AsyncGET(FieldsMethodMixin, AsyncOutreprsMethodMixin, AsyncMethod):
+    pass
+
+class AsyncHEAD(FieldsMethodMixin, AsyncMethod):
+    pass
+
+class AsyncPOST(FieldsMethodMixin, InreprsMethodMixin,
+                AsyncOutreprsMethodMixin, AsyncMethod):
+    pass
+
+class AsyncPUT(InreprsMethodMixin, AsyncMethod):
+    pass
+
+class AsyncDELETE(AsyncMethod):
+    pass
+
+
+class AsyncServer(object):
+    """HTTP/1.1 server handling the requests for an AsyncApplication
+    on an event loop, with persistent connections. The request body
+    is read completely before the request is handled.
+    """
+
+    server_software = 'wrapid-async'
+    keepalive       = 5.0               # Seconds to keep idle connection
+    max_header_size = 65536             # Bytes; request line and headers
+    max_body_size   = 2**26             # Bytes
+
+    def __init__(self, application, host='127.0.0.1', port=8000,
+                 keepalive=None, loop=None):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive or self.keepalive
+        self.loop = loop or asyncio.get_event_loop()
+        self.server = None
+
+    @asyncio.coroutine
+    def start(self):
+        "Start listening for connections."
+        self.server = yield From(asyncio.start_server(self.handle_connection,
+                                                      self.host,
+                                                      self.port,
+                                                      loop=self.loop))
+
+    def serve_forever(self):
+        "Run the event loop in this thread until interrupted."
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.start())
+        logging.info("wrapid: serving on http://%s:%s/", self.host, self.port)
+        try:
+            self.loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+
+    @asyncio.coroutine
+    def handle_connection(self, reader, writer):
+        "Handle the requests of a connection, while kept alive."
+        try:
+            while True:
+                try:
+                    line = yield From(asyncio.wait_for(reader.readline(),
+                                                       self.keepalive,
+                                                       loop=self.loop))
+                except asyncio.TimeoutError:
+                    break
+                if not line: break
+                keep_alive = yield From(self.handle_request(line,
+                                                            reader,
+                                                            writer))
+                yield From(writer.drain())
+                if not keep_alive: break
+        except (asyncio.IncompleteReadError, EnvironmentError):
+            pass
+        except Exception:
+            logging.exception('wrapid: server failure')
+        finally:
+            writer.close()
+
+    @asyncio.coroutine
+    def handle_request(self, line, reader, writer):
+        """Read the request given the request line, and write the response.
+        Return True if the connection is to be kept alive.
+        """
+        try:
+            method, target, version = line.split()
+            if not version.startswith('HTTP/1.'): raise ValueError
+        except ValueError:
+            self.write_error(writer, HTTP_BAD_REQUEST('invalid request line'))
+            raise Return(False)
+        headers = []
+        size = len(line)
+        while True:
+            line = yield From(reader.readline())
+            size += len(line)
+            if size > self.max_header_size:
+                self.write_error(writer, HTTP_BAD_REQUEST('headers too large'))
+                raise Return(False)
+            line = line.rstrip('\r\n')
+            if not line: break
+            if line[0] in ' \t' and headers: # Continuation line
+                headers[-1][1] += ' ' + line.strip()
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                self.write_error(writer, HTTP_BAD_REQUEST('invalid header'))
+                raise Return(False)
+            headers.append([name.strip(), value.strip()])
+        lookup = dict([(n.lower(), v) for n, v in headers])
+        if lookup.get('transfer-encoding', 'identity').lower() != 'identity':
+            self.write_error(writer, HTTP_BAD_REQUEST('chunked request body'
+                                                      ' not supported'))
+            raise Return(False)
+        try:
+            length = int(lookup.get('content-length') or 0)
+            if length < 0: raise ValueError
+        except ValueError:
+            self.write_error(writer, HTTP_BAD_REQUEST('invalid Content-Length'))
+            raise Return(False)
+        if length > self.max_body_size:
+            self.write_error(writer, HTTP_REQUEST_ENTITY_TOO_LARGE(
+                'request body too large'))
+            raise Return(False)
+        body = yield From(reader.readexactly(length))
+        connection = lookup.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+        environ = self.get_environ(writer, method, target, version,
+                                   headers, body)
+        request, response = yield From(self.application.handle_async(environ))
+        output = dict()
+        def start_response(status, headers, exc_info=None):
+            output['status'] = status
+            output['headers'] = headers
+        result = self.application.finish(request, response, start_response)
+        try:
+            keep_alive = yield From(self.write_response(writer,
+                                                        method,
+                                                        version,
+                                                        output['status'],
+                                                        output['headers'],
+                                                        result,
+                                                        keep_alive))
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        raise Return(keep_alive)
+
+    def get_environ(self, writer, method, target, version, headers, body):
+        "Return the WSGI-style environment for the request."
+        path, sep, query = target.partition('?')
+        if path.startswith('http://') or path.startswith('https://'):
+            path = '/' + path.split('/', 3)[-1]
+        peer = writer.get_extra_info('peername') or ('', 0)
+        environ = {'REQUEST_METHOD': method,
+                   'SCRIPT_NAME': '',
+                   'PATH_INFO': urllib.unquote(path),
+                   'QUERY_STRING': query,
+                   'SERVER_NAME': self.host,
+                   'SERVER_PORT': str(self.port),
+                   'SERVER_PROTOCOL': version,
+                   'SERVER_SOFTWARE': self.server_software,
+                   'REMOTE_ADDR': peer[0],
+                   'CONTENT_LENGTH': str(len(body)),
+                   'wsgi.version': (1, 0),
+                   'wsgi.url_scheme': 'http',
+                   'wsgi.input': cStringIO.StringIO(body),
+                   'wsgi.errors': cStringIO.StringIO(),
+                   'wsgi.multithread': False,
+                   'wsgi.multiprocess': False,
+                   'wsgi.run_once': False}
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            if key in environ and key.startswith('HTTP_'):
+                environ[key] += ',' + value
+            else:
+                environ[key] = value
+        if not body:
+            del environ['CONTENT_LENGTH']
+        return environ
+
+    @asyncio.coroutine
+    def write_response(self, writer, method, version, status, headers,
+                       result, keep_alive):
+        """Write the response to the client, waiting for the transport
+        to drain after each chunk of the body, so that a large body is
+        not buffered in memory. Return True if the connection is to be
+        kept alive.
+        """
+        code = status.split(' ', 1)[0]
+        no_body = method == 'HEAD' or code in ('204', '304') or \
+                  code.startswith('1')
+        names = set([n.lower() for n, v in headers])
+        headers = list(headers)
+        if 'date' not in names:
+            headers.append(('Date', email.utils.formatdate(usegmt=True)))
+        if 'server' not in names:
+            headers.append(('Server', self.server_software))
+        chunked = False
+        body = None
+        if no_body:
+            pass
+        elif 'content-length' in names:
+            pass
+        elif isinstance(result, Response) and result.buffered:
+            body = ''.join(result)
+            headers.append(('Content-Length', str(len(body))))
+        elif version == 'HTTP/1.1':
+            headers.append(('Transfer-Encoding', 'chunked'))
+            chunked = True
+        else:
+            keep_alive = False
+        if 'connection' in names:
+            for name, value in headers:
+                if name.lower() == 'connection' and value.lower() == 'close':
+                    keep_alive = False
+        elif not keep_alive:
+            headers.append(('Connection', 'close'))
+        elif version == 'HTTP/1.0':
+            headers.append(('Connection', 'keep-alive'))
+        lines = ["%s %s" % (version, status)]
+        lines.extend(["%s: %s" % header for header in headers])
+        lines.append('\r\n')
+        writer.write('\r\n'.join(lines))
+        if no_body:
+            raise Return(keep_alive)
+        if body is not None:
+            writer.write(body)
+        elif chunked:
+            for data in result:
+                if data:
+                    writer.write("%x\r\n%s\r\n" % (len(data), data))
+                    yield From(writer.drain())
+            writer.write('0\r\n\r\n')
+        else:
+            for data in result:
+                writer.write(data)
+                yield From(writer.drain())
+        raise Return(keep_alive)
+
+    def write_error(self, writer, error):
+        "Write the error response, and close the connection."
+        body = "%s\n\n%s" % (error, ''.join(error.content))
+        writer.write("HTTP/1.1 %s\r\n"
+                     "Content-Type: text/plain\r\n"
+                     "Content-Length: %s\r\n"
+                     "Connection: close\r\n\r\n%s" % (error, len(body), body))
+
+
+def serve(application, host='127.0.0.1', port=8000, keepalive=None):
+    "Serve the AsyncApplication on the default event loop until interrupted."
+    AsyncServer(application, host=host, port=port,
+                keepalive=keepalive).serve_forever()
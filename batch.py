@@ -0,0 +1,154 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+Batch method class: handle many sub-requests in one HTTP request.
+
+The input is a JSON list of objects with the items 'method', 'path'
+(relative to the application URL, optionally with a query), 'headers'
+(optional object) and 'body' (optional; a string, or else JSON-encoded).
+Each sub-request is dispatched in-process by the application.
+The output is a JSON list of objects with the items 'status' (integer),
+'headers' (list of [name, value]) and 'body' (string). A body which
+is not UTF-8 is base64-encoded, and the item 'encoding' is 'base64'.
+A sub-request may not itself be a batch request.
+
+    application.add_resource('/batch', name='Batch', POST=POST_Batch)
+"""
+
+import base64
+import threading
+import Queue
+from cStringIO import StringIO
+
+from .methods import *
+from . import jsoncodec
+
+
+class POST_Batch(Method):
+    """Handle a list of sub-requests given as JSON, and return
+    the list of their responses as JSON.
+    If all sub-requests are GET or HEAD, and 'threads' is larger than 1,
+    then they are handled concurrently by that many threads.
+    Otherwise they are handled in order.
+    """
+
+    max_requests = 100
+    threads      = 0
+
+    # Headers of the batch request passed on to the sub-requests.
+    INHERITED_HEADERS = ['HTTP_AUTHORIZATION', 'HTTP_COOKIE']
+
+    # Keys of the WSGI environ passed on to the sub-requests.
+    INHERITED_KEYS = ['SCRIPT_NAME', 'SERVER_NAME', 'SERVER_PORT',
+                      'SERVER_PROTOCOL', 'REMOTE_ADDR',
+                      'wsgi.version', 'wsgi.url_scheme', 'wsgi.errors',
+                      'wsgi.multithread', 'wsgi.multiprocess',
+                      'wsgi.run_once', 'HTTP_HOST']
+
+    # Key set in the WSGI environ of the sub-requests.
+    ENVIRON_FLAG = 'wrapid.batch'
+
+    def prepare(self, request):
+        if request.environ.get(self.ENVIRON_FLAG):
+            raise HTTP_BAD_REQUEST('batch request within batch request')
+        if not isinstance(request.json, list):
+            raise HTTP_BAD_REQUEST('input must be a JSON list')
+        if len(request.json) > self.max_requests:
+            raise HTTP_BAD_REQUEST("more than %s sub-requests"
+                                   % self.max_requests)
+        self.environs = []
+        for item in request.json:
+            try:
+                self.environs.append(self.get_environ(request, item))
+            except (KeyError, TypeError, ValueError, AttributeError), msg:
+                raise HTTP_BAD_REQUEST("invalid sub-request: %s" % msg)
+
+    def get_environ(self, request, item):
+        "Return the WSGI environ for the sub-request item."
+        environ = {self.ENVIRON_FLAG: True}
+        for key in self.INHERITED_KEYS + self.INHERITED_HEADERS:
+            try:
+                environ[key] = request.environ[key]
+            except KeyError:
+                pass
+        method = str(item.get('method', 'GET')).upper()
+        path = str(item['path'])
+        if not path.startswith('/'):
+            raise ValueError("path must begin with '/'")
+        path, sep, query = path.partition('?')
+        environ['REQUEST_METHOD'] = method
+        environ['PATH_INFO'] = path
+        environ['QUERY_STRING'] = query
+        environ['HTTP_ACCEPT'] = 'application/json'
+        for name, value in (item.get('headers') or dict()).items():
+            key = str(name).upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = str(value)
+        body = item.get('body')
+        if body is None:
+            body = ''
+        elif isinstance(body, unicode):
+            body = body.encode('utf-8')
+        elif not isinstance(body, str):
+            body = jsoncodec.dumps(body)
+            environ.setdefault('CONTENT_TYPE', 'application/json')
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ['wsgi.input'] = StringIO(body)
+        return environ
+
+    def process(self, request):
+        self.results = [None] * len(self.environs)
+        safe = all([e['REQUEST_METHOD'] in ('GET', 'HEAD')
+                    for e in self.environs])
+        if safe and self.threads > 1 and len(self.environs) > 1:
+            queue = Queue.Queue()
+            for pos in xrange(len(self.environs)):
+                queue.put(pos)
+            workers = []
+            for i in xrange(min(self.threads, len(self.environs))):
+                worker = threading.Thread(target=self.work,
+                                          args=(request, queue))
+                worker.start()
+                workers.append(worker)
+            for worker in workers:
+                worker.join()
+        else:
+            for pos, environ in enumerate(self.environs):
+                self.results[pos] = self.handle(request, environ)
+
+    def work(self, request, queue):
+        "Handle sub-requests from the queue until it is empty."
+        while True:
+            try:
+                pos = queue.get_nowait()
+            except Queue.Empty:
+                return
+            self.results[pos] = self.handle(request, self.environs[pos])
+
+    def handle(self, request, environ):
+        "Handle the sub-request, returning the result dictionary."
+        output = dict()
+        def start_response(status, headers, exc_info=None):
+            output['status'] = int(status.split()[0])
+            output['headers'] = headers
+            return output.setdefault('body', []).append
+        result = request.application.handle(environ, start_response)
+        try:
+            body = output.setdefault('body', [])
+            body.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        body = ''.join(body)
+        output['headers'] = [list(h) for h in output['headers']]
+        try:
+            output['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            output['body'] = base64.b64encode(body)
+            output['encoding'] = 'base64'
+        return output
+
+    def get_response(self, request):
+        response = HTTP_OK(content_type='application/json; charset=utf-8')
+        response.append(jsoncodec.dumps(self.results))
+        return response
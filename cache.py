@@ -0,0 +1,200 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+Cache of complete responses for GET method classes.
+
+The cache is an attribute of the application. A GET method class
+inheriting from ResponseCacheMixin serves a cached response, if any,
+before its data is collected. The cache key is the URL, the query,
+the outgoing representation class and the login account name, if any.
+
+    application = Application(response_cache=ResponseCache())
+
+    class Home(ResponseCacheMixin, GET): ...
+
+    class POST_Entity(InvalidateResponseCacheMixin, POST):
+        def process(self, request):
+            ...
+            self.invalidate_response_cache(request)
+"""
+
+import time
+import threading
+import urllib
+import cgi
+import wsgiref.headers
+
+from .responses import *
+from .utils import LruCache
+
+
+class ResponseCache(object):
+    """Bounded cache of responses. The least recently used response
+    is discarded when the number of responses or the total size of
+    their bodies exceeds the limit. A response expires after
+    the time-to-live. Thread-safe.
+    """
+
+    def __init__(self, maxsize=1000, maxbytes=2**25, ttl=600):
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.entries = LruCache(maxsize)
+        self.lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return a new response instance from the cached entry.
+        Raise KeyError if none, or if expired.
+        """
+        with self.lock:
+            try:
+                entry = self.entries[key]
+                if entry.expires < time.time():
+                    self._remove(key)
+                    raise KeyError(key)
+            except KeyError:
+                self.misses += 1
+                raise
+            self.hits += 1
+        response = entry.klass()
+        response.headers = wsgiref.headers.Headers(list(entry.headers))
+        response.append(entry.body)
+        return response
+
+    def set(self, key, response, ttl=None):
+        """Store the status, headers and body of the response, unless
+        the body is larger than the limit of the total size. The body
+        is consumed; return a new response instance to use in place
+        of the given one.
+        """
+        body = ''.join(response)
+        size = len(body)
+        entry = _Entry(response.__class__,
+                       response.headers.items(),
+                       body,
+                       time.time() + (ttl or self.ttl))
+        result = entry.klass()
+        result.headers = wsgiref.headers.Headers(list(entry.headers))
+        result.append(body)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if size > self.maxbytes: return result
+            while len(self.entries) and \
+                  (len(self.entries) >= self.entries.maxsize or
+                   self.nbytes + size > self.maxbytes):
+                old = self.entries.popitem()[1]
+                self.nbytes -= len(old.body)
+            self.entries[key] = entry
+            self.nbytes += size
+        return result
+
+    def invalidate(self, url):
+        """Remove all responses for the URL, and for any URL below it.
+        The URL is given without query or format suffix.
+        """
+        url = url.rstrip('/')
+        below = url + '/'
+        with self.lock:
+            for key in self.entries.keys():
+                if key[0] == url or key[0].startswith(below):
+                    self._remove(key)
+
+    def clear(self):
+        "Remove all responses."
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def get_stats(self):
+        "Return a dictionary with the size, bytes, hits and misses."
+        return dict(size=len(self.entries),
+                    maxsize=self.entries.maxsize,
+                    bytes=self.nbytes,
+                    maxbytes=self.maxbytes,
+                    hits=self.hits,
+                    misses=self.misses)
+
+    def _remove(self, key):
+        "Remove the entry; the lock must be held by the caller."
+        self.nbytes -= len(self.entries.peek(key).body)
+        del self.entries[key]
+
+
+class _Entry(object):
+    "A cached response."
+
+    def __init__(self, klass, headers, body, expires):
+        self.klass = klass
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+
+
+class ResponseCacheMixin(object):
+    """Mixin class for GET method classes, serving the response from
+    the cache of the application, if any. Must precede the GET class
+    in the list of base classes. Only HTTP_OK responses without cookies
+    are cached, and not those streamed, i.e. not buffered.
+    """
+
+    response_cache_ttl = None           # Seconds; default that of the cache
+
+    def get_response(self, request):
+        cache = request.application.response_cache
+        if cache is None:
+            return super(ResponseCacheMixin, self).get_response(request)
+        with request.timing('outrepr'):
+            outrepr = self.get_outrepr(request)
+        key = self.get_response_cache_key(request, outrepr)
+        try:
+            with request.timing('cache'):
+                response = cache.get(key)
+        except KeyError:
+            pass
+        else:
+            self.check_etag(request, response.headers['ETag'])
+            return response
+        with request.timing('data'):
+            data = self.get_data(request)
+        with request.timing('representation'):
+            response = outrepr(data)
+        etag = self.etag and self.set_etag_body(response)
+        if response.__class__ is HTTP_OK and response.buffered and \
+           not response.headers.get('Set-Cookie'):
+            response = cache.set(key, response, ttl=self.response_cache_ttl)
+        self.check_etag(request, etag)
+        return response
+
+    def get_response_cache_key(self, request, outrepr):
+        """Return the cache key for the request: the URL, the sorted query,
+        the outgoing representation class, whether the user agent is
+        a browser, and the login account name.
+        """
+        query = cgi.parse_qsl(request.environ.get('QUERY_STRING', ''),
+                              keep_blank_values=True)
+        try:
+            login = self.login['name']
+        except (AttributeError, KeyError, TypeError):
+            login = None
+        return (request.url.rstrip('/'),
+                urllib.urlencode(sorted(query)),
+                outrepr.__class__,
+                outrepr.human_user_agent,
+                login)
+
+
+class InvalidateResponseCacheMixin(object):
+    "Mixin class for method classes which modify resources."
+
+    def invalidate_response_cache(self, request, url=None):
+        """Remove the cached responses for the URL, by default that
+        of the request, and for any URL below it.
+        """
+        cache = request.application.response_cache
+        if cache is not None:
+            cache.invalidate(url or request.url)
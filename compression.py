@@ -0,0 +1,151 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+Compression of the response body, negotiated from the 'Accept-Encoding'
+header of the request. The body is compressed incrementally as it is
+iterated over by the web server, so streamed responses stay streamed.
+"""
+
+import zlib
+
+
+# Window bits for the zlib compressor giving the respective format.
+ENCODINGS = dict(gzip=16 + zlib.MAX_WBITS,
+                 deflate=zlib.MAX_WBITS)
+
+# Mimetypes whose content is already compressed.
+COMPRESSED_MIMETYPE_PREFIXES = ('image/', 'audio/', 'video/',
+                                'application/zip',
+                                'application/gzip',
+                                'application/x-gzip',
+                                'application/x-bzip2',
+                                'application/x-7z-compressed',
+                                'application/pdf',
+                                'application/octet-stream')
+UNCOMPRESSED_MIMETYPES = set(['image/svg+xml', 'image/x-icon'])
+
+
+def get_encoding(accept_encoding):
+    """Return the content encoding to use, given the value of
+    the 'Accept-Encoding' header, or None if no compression.
+    gzip is preferred over deflate when the quality values are equal.
+    """
+    if not accept_encoding: return None
+    qualities = dict()
+    for part in accept_encoding.split(','):
+        params = part.split(';')
+        coding = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            key, sep, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    best = None
+    for coding in ('gzip', 'deflate'):
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > 0.0 and (best is None or quality > best[1]):
+            best = (coding, quality)
+    return best and best[0]
+
+
+def is_compressible(response, min_size):
+    """Is it worthwhile to compress the body of the response?
+    Not if it is already encoded, has a compressed mimetype,
+    or is held in memory and is smaller than the given size.
+    """
+    if not response.http_code or response.http_code in (204, 304):
+        return False
+    if response.headers['Content-Encoding']:
+        return False
+    mimetype = (response.headers['Content-Type'] or '').split(';')[0]
+    mimetype = mimetype.strip().lower()
+    if mimetype not in UNCOMPRESSED_MIMETYPES and \
+       mimetype.startswith(COMPRESSED_MIMETYPE_PREFIXES):
+        return False
+    if response.buffered:
+        size = 0
+        for item in response.content:
+            size += len(str(item))
+            if size >= min_size: break
+        else:
+            return False
+    return True
+
+
+def set_vary(response):
+    """Add 'Accept-Encoding' to the 'Vary' header; the body of
+    the response depends on it, whether compressed or not.
+    """
+    vary = response.headers['Vary']
+    if not vary:
+        response.headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        response.headers['Vary'] = vary + ', Accept-Encoding'
+
+
+def set_headers(response, encoding):
+    "Set the headers of the response for the given content encoding."
+    response.headers['Content-Encoding'] = encoding
+    del response.headers['Content-Length']
+    etag = response.headers['ETag']
+    if etag and etag.endswith('"'):     # Differs from uncompressed entity
+        response.headers['ETag'] = "%s-%s\"" % (etag[:-1], encoding)
+
+
+def set_not_modified_etag(response, encoding, if_none_match):
+    """Set the ETag of the 'Not Modified' response to that of the entity
+    compressed with the given encoding, if that is the one the client
+    has, as given by the value of the 'If-None-Match' header.
+    """
+    etag = response.headers['ETag']
+    if not (encoding and if_none_match and etag and etag.endswith('"')):
+        return
+    encoded = "%s-%s\"" % (etag[:-1], encoding)
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == encoded:
+            response.headers['ETag'] = encoded
+            return
+
+
+def strip_etag(etag):
+    "Return the ETag without any content encoding suffix."
+    for encoding in ENCODINGS:
+        suffix = "-%s\"" % encoding
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+class CompressedBody(object):
+    """Iterable compressing the chunks of the given body iterable.
+    If 'flush' is true, then the compressed data is flushed for each chunk,
+    so that a streamed body is sent to the client as it is produced.
+    """
+
+    def __init__(self, body, encoding, level=6, flush=False):
+        self.body = body
+        self.compressor = zlib.compressobj(level,
+                                           zlib.DEFLATED,
+                                           ENCODINGS[encoding])
+        self.flush = flush
+
+    def __iter__(self):
+        compressor = self.compressor
+        for chunk in self.body:
+            data = compressor.compress(chunk)
+            if self.flush:
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def close(self):
+        "Close the body iterable, as required by WSGI."
+        if hasattr(self.body, 'close'):
+            self.body.close()
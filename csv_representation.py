@@ -0,0 +1,68 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+CSV representation, for bulk output of tabular collections.
+"""
+
+import csv
+import cStringIO
+
+from .representation import *
+
+
+class CsvRepresentation(Representation):
+    """CSV representation of the rows of the resource. The rows are
+    the list or iterator which is the entry 'rows_key' of the data
+    dictionary. They are written as they are obtained, and streamed
+    to the client.
+
+    A row is either a sequence of values, or a dictionary. In the latter
+    case, the columns are given by the entry 'columns_key' of the data
+    dictionary, if any, else by the sorted keys of the first row.
+    The first line then contains the column names.
+    """
+
+    mimetype = 'text/csv'
+    charset = 'utf-8'
+    format = 'csv'
+    rows_key = 'rows'
+    columns_key = 'columns'
+    dialect = 'excel'
+
+    def __call__(self, data):
+        response = HTTP_OK(**self.get_http_headers())
+        response.buffered = False
+        response.content = self.iterencode(data)
+        return response
+
+    def iterencode(self, data):
+        "Yield chunks of at least 'buffer_size' bytes of CSV lines."
+        buffer = cStringIO.StringIO()
+        writer = csv.writer(buffer, dialect=self.dialect)
+        rows = iter(data.get(self.rows_key) or [])
+        try:
+            first = rows.next()
+        except StopIteration:
+            return
+        if isinstance(first, dict):
+            columns = data.get(self.columns_key) or sorted(first.keys())
+            writer.writerow(map(self.encode, columns))
+            rows = (map(row.get, columns) for row in rows)
+            first = map(first.get, columns)
+        writer.writerow(map(self.encode, first))
+        for row in rows:
+            writer.writerow(map(self.encode, row))
+            if buffer.tell() >= self.buffer_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def encode(self, value):
+        "Return the value as a string suitable for the csv writer."
+        if value is None:
+            return ''
+        elif isinstance(value, unicode):
+            return value.encode('utf-8')
+        else:
+            return value
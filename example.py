@@ -117,7 +117,7 @@ class GET_Input(MethodMixin, GET):
                     form=dict(title='Input text',
                               fields=self.get_data_fields(),
                               href=request.url,
-                              cancel=request.application.url))
+                              cancel=request.application_url))
 
 
 class POST_Input(MethodMixin, POST):
@@ -145,7 +145,7 @@ class POST_Input(MethodMixin, POST):
                     form=dict(title='Paste in text',
                               fields=self.get_data_fields(),
                               href=request.url,
-                              quit=request.application.url))
+                              quit=request.application_url))
 
 
 def text(request):
@@ -175,7 +175,7 @@ def json(request):
 def debug(request):
     "Return information about the request data. Function for HTTP method."
     response = HTTP_OK(content_type='text/plain')
-    response.append("Application URL: %s\n" % request.application.url)
+    response.append("Application URL: %s\n" % request.application_url)
     response.append("   Resource URL: %s\n\n" % request.url)
     response.append('HTTP headers\n------------\n\n')
     for item in sorted(request.headers.items()):
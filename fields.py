@@ -219,10 +219,25 @@ add_field_class(TextField)
 
 
 class FileField(Field):
-    "File upload field; file content and information returned as a dictionary."
+    """File upload field; file content and information returned as a dictionary.
+    The item 'file' is a file-like object for the content, and 'path'
+    the name of the temporary file holding it, if spooled to disk.
+    If 'read' is True, then the item 'value' is the content as a string;
+    set it to False to avoid reading large files into memory.
+    """
 
     type = 'file'
 
+    def __init__(self, name, id=None, title=None, required=False, default=None,
+                 read=True, descr=None):
+        super(FileField, self).__init__(name,
+                                        id=id,
+                                        title=title,
+                                        required=required,
+                                        default=default,
+                                        descr=descr)
+        self.read = read
+
     def get_value(self, request, method):
         """Return the file content and information as a dictionary.
         Raise ValueError if invalid.
@@ -241,9 +256,14 @@ class FileField(Field):
 
     def converter(self, value):
         "Convert into a dictionary."
-        return dict(value=value.file.read(),
-                    filename=value.filename,
-                    type=value.type)
+        result = dict(file=value.file,
+                      path=getattr(value, 'path', None),
+                      size=getattr(value, 'size', None),
+                      filename=value.filename,
+                      type=value.type)
+        if self.read:
+            result['value'] = value.value
+        return result
 
 add_field_class(FileField)
 
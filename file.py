@@ -95,6 +95,8 @@ class File(GET):
 class HTTP_OK_Static(HTTP_OK):
     "Return the contents of a static file in chunks."
 
+    buffered = False
+
     def open(self, fullpath, chunk_size=2**20):
         self.file = open(fullpath)
         self.chunk_size = chunk_size
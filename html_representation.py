@@ -4,12 +4,14 @@ Base class for standard HTML 4.0 representation.
 """
 
 import cgi
+import hashlib
+import threading
 
 import markdown
 
 from .HTML4 import *
 from .representation import *
-from .utils import url_build
+from .utils import url_build, LruCache
 
 
 class BaseHtmlRepresentation(Representation):
@@ -29,43 +31,122 @@ class BaseHtmlRepresentation(Representation):
 
     scripts = []                        # List of relative URLs
 
+    compiled = True                     # Render layout from fragments
+
+    # Parts that depend only on the application and the class; cached
+    # when compiled. Remove a part from this if its method is overridden
+    # to use other data.
+    cached_parts = ('logo', 'footer', 'scripts')
+    part_cache_size = 64
+
+    # Markdown texts converted to HTML, shared by all instances.
+    markdown_cache = LruCache(1024)
+
     def __call__(self, data):
         self.data = data
         self.prepare()
-        html = HTML(self.get_head(),
-                    BODY(TABLE(TR(TD(TABLE(TR(TD(self.get_logo(),
+        response = HTTP_OK(**self.get_http_headers())
+        response.append(DOCTYPE + '\n')
+        if self.compiled:
+            response.append(self.get_compiled_html())
+        else:
+            response.append(self.get_html(self.get_part))
+        return response
+
+    def get_html(self, part):
+        """Return the HTML element for the standard page layout.
+        The callable 'part' is called with the name of each part
+        of the page, in order, and returns its content.
+        The layout must not depend on the data, since it is compiled
+        only once for each class.
+        """
+        return HTML(part('head'),
+                    BODY(TABLE(TR(TD(TABLE(TR(TD(part('logo'),
                                                  klass='logo')),
-                                           TR(TD(self.get_navigation(),
+                                           TR(TD(part('navigation'),
                                                  klass='navigation'))),
                                      klass='body_left'),
-                                  TD(H1(self.get_title(), klass='title'),
-                                     DIV(self.get_descr(), klass='descr'),
-                                     DIV(self.get_content(), klass='content'),
+                                  TD(H1(part('title'), klass='title'),
+                                     DIV(part('descr'), klass='descr'),
+                                     DIV(part('content'), klass='content'),
                                      klass='body_middle'),
-                                  TD(TABLE(TR(TD(self.get_search(),
+                                  TD(TABLE(TR(TD(part('search'),
                                                  klass='search')),
-                                           TR(TD(self.get_login(),
+                                           TR(TD(part('login'),
                                                  klass='login')),
-                                           TR(TD(self.get_documentation(),
+                                           TR(TD(part('documentation'),
                                                  klass='documentation')),
-                                           TR(TD(self.get_info(),
+                                           TR(TD(part('info'),
                                                  klass='info')),
-                                           TR(TD(self.get_operations(),
+                                           TR(TD(part('operations'),
                                                  klass='operations')),
-                                           TR(TD(self.get_metadata(),
+                                           TR(TD(part('metadata'),
                                                  klass='metadata')),
-                                           TR(TD(self.get_outreprs(),
+                                           TR(TD(part('outreprs'),
                                                  klass='outreprs')),
                                            style='float: right;'),
                                      klass='body_right')),
                                width='100%'),
-                         HR(),
-                         self.get_footer(),
-                         self.get_scripts()))
-        response = HTTP_OK(**self.get_http_headers())
-        response.append(DOCTYPE + '\n')
-        response.append(html)
-        return response
+                         part('hr'),
+                         part('footer'),
+                         part('scripts')))
+
+    def get_part(self, name):
+        "Return the content of the named part of the page."
+        return getattr(self, "get_%s" % name)()
+
+    def get_compiled_html(self):
+        """Return the encoded HTML for the standard page layout,
+        which has been compiled into fixed fragments with slots for
+        the parts. Each part is rendered at the indent of its slot.
+        The output is identical to that of the element tree.
+        """
+        klass = self.__class__
+        try:
+            fragments = klass.__dict__['_fragments']
+        except KeyError:
+            fragments = compile_html(self.get_html(Slot))
+            klass._fragments = fragments
+        result = [fragments[0]]
+        for pos in xrange(1, len(fragments), 2):
+            name, indent = fragments[pos]
+            result.append(self.render_part(name, indent))
+            result.append(fragments[pos+1])
+        return u''.join(result).encode(ENCODING)
+
+    def render_part(self, name, indent):
+        """Return the unicode for the named part rendered at the indent.
+        A cached part is taken from the cache of the class, if there.
+        """
+        key = self.get_part_key(name)
+        if key is None or not self.part_cache_size:
+            return render(self.get_part(name), indent)
+        key = (name, indent) + key
+        klass = self.__class__
+        try:
+            cache = klass.__dict__['_part_cache']
+        except KeyError:
+            cache = klass._part_cache = LruCache(self.part_cache_size)
+        try:
+            return cache[key]
+        except KeyError:
+            result = cache[key] = render(self.get_part(name), indent)
+            return result
+
+    def get_part_key(self, name):
+        """Return the key for the cached rendering of the named part:
+        the application data which it depends on. Return None if the
+        part is not to be cached.
+        """
+        if name not in self.cached_parts: return None
+        application = self.data['application']
+        host = application.get('host')
+        if isinstance(host, dict):
+            host = tuple(sorted(host.items()))
+        return (application.get('name'),
+                application.get('version'),
+                application.get('href'),
+                host)
 
     def get_url(self, *segments, **query):
         "Return a URL based on the application URL."
@@ -117,6 +198,9 @@ class BaseHtmlRepresentation(Representation):
                              rel='shortcut icon'))
         return head
 
+    def get_hr(self):
+        return HR()
+
     def get_title(self):
         "Return the title of the page; both for header and body."
         return self.data['title']
@@ -319,11 +403,60 @@ class BaseHtmlRepresentation(Representation):
             return ''
 
     def to_html(self, text):
-        "Format the text into HTML, using Markdown formatting."
-        if text:
-            return markdown.markdown(cgi.escape(text), output_format='html4')
+        """Format the text into HTML, using Markdown formatting.
+        The result is kept in 'markdown_cache', keyed by the digest
+        of the text.
+        """
+        if not text: return ''
+        if isinstance(text, unicode):
+            key = hashlib.sha1(text.encode('utf-8')).digest()
         else:
-            return ''
+            key = hashlib.sha1(text).digest()
+        try:
+            return self.markdown_cache[key]
+        except KeyError:
+            result = markdown_to_html(cgi.escape(text))
+            self.markdown_cache[key] = result
+            return result
+
+
+_local = threading.local()
+
+def markdown_to_html(text):
+    """Convert the Markdown text to HTML, using the Markdown instance
+    of the current thread, which avoids setting up the extensions
+    for every conversion.
+    """
+    try:
+        converter = _local.markdown
+    except AttributeError:
+        converter = _local.markdown = markdown.Markdown(output_format='html4')
+    try:
+        return converter.convert(text)
+    finally:
+        converter.reset()
+
+
+class Slot(object):
+    "Placeholder for a part of the page when compiling the layout."
+
+    def __init__(self, name):
+        self.name = name
+
+    def __unicode__(self, indent=0, perlevel=2):
+        return u"\0%s\0%s\0" % (self.name, indent)
+
+
+def compile_html(element):
+    """Return the list of fragments for the element containing Slot
+    instances: unicode strings alternating with (name, indent) tuples.
+    """
+    parts = str(element).decode(ENCODING).split(u'\0')
+    fragments = [parts[0]]
+    for pos in xrange(1, len(parts), 3):
+        fragments.append((str(parts[pos]), int(parts[pos+1])))
+        fragments.append(parts[pos+2])
+    return fragments
 
 
 class FormHtmlMixin(object):
@@ -6,17 +6,93 @@ JSON representation.
 import json
 
 from .representation import *
+from . import jsoncodec
 
 
 class JsonRepresentation(Representation):
-    "JSON representation of the resource."
+    """JSON representation of the resource.
+    Indented if the user agent is a browser, else compact.
+
+    If 'streaming' is True, or if any entry in the data dictionary
+    is a generator or other iterator, then the body is produced while
+    it is being sent, in chunks of about 'buffer_size' bytes. An iterator
+    is output as a JSON array, each item being encoded as it is obtained.
+    The output is then compact, and no ETag is computed.
+    """
 
     mimetype = 'application/json'
     charset = 'utf-8'
     format = 'json'
-    indent = 2
+    indent = 2                          # For browsers only
+    streaming = False
 
     def __call__(self, data):
         response = HTTP_OK(**self.get_http_headers())
-        response.append(json.dumps(data, indent=self.indent))
+        if self.streaming or self.has_iterator(data):
+            response.buffered = False
+            response.content = self.coalesce(self.iterencode(data))
+        else:
+            response.append(jsoncodec.dumps(data,
+                                            indent=self.human_user_agent and
+                                                   self.indent))
         return response
+
+    def iterencode(self, data):
+        """Yield the chunks of the JSON document for the data.
+        Any iterator, at the top level or as an entry in the data
+        dictionary, becomes an array which is encoded item by item.
+        Other values are encoded by JSONEncoder.iterencode.
+        """
+        encoder = json.JSONEncoder(separators=(',', ':'),
+                                   default=self.default)
+        if isinstance(data, dict):
+            yield '{'
+            separator = ''
+            for key, value in data.iteritems():
+                yield separator
+                yield encoder.encode(self.key_to_string(encoder, key))
+                yield ':'
+                for chunk in self.iterencode_value(encoder, value):
+                    yield chunk
+                separator = ','
+            yield '}'
+        else:
+            for chunk in self.iterencode_value(encoder, data):
+                yield chunk
+
+    def key_to_string(self, encoder, key):
+        """Return the dictionary key as a string, the way the json module
+        does. Raise TypeError if the key is of any other type.
+        """
+        if isinstance(key, basestring):
+            return key
+        elif key is True:
+            return 'true'
+        elif key is False:
+            return 'false'
+        elif key is None:
+            return 'null'
+        elif isinstance(key, float):
+            return encoder.encode(key)
+        elif isinstance(key, (int, long)):
+            return str(key)
+        raise TypeError("key %r is not a string" % (key,))
+
+    def iterencode_value(self, encoder, value):
+        if is_iterator(value):
+            yield '['
+            separator = ''
+            for item in value:
+                yield separator
+                yield jsoncodec.dumps(item)
+                separator = ','
+            yield ']'
+        else:
+            for chunk in encoder.iterencode(value):
+                yield chunk
+
+    def default(self, value):
+        "Encode an iterator deeper down in the data as an array."
+        if is_iterator(value):
+            return list(value)
+        raise TypeError(repr(value) + " is not JSON serializable")
@@ -0,0 +1,100 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+JSON encoding and decoding through a registry of codecs, by name.
+The standard library codec is used unless another has been chosen
+by 'set_codec'; faster backends must be enabled explicitly. The ujson
+package is several times faster, but differs in some respects, and is
+enabled by set_codec('ujson').
+
+Output is compact unless an indent is given; indentation is meant
+for human readers, and makes the standard library encoder much slower.
+"""
+
+import json
+
+
+CODECS = dict()                         # Codec classes by name
+_codec = None                           # Codec instance in use
+
+
+class Codec(object):
+    "JSON codec using the 'json' module of the standard library."
+
+    name = 'json'
+
+    def dumps(self, data, indent=None):
+        "Return the JSON string for the data; compact if no indent."
+        if indent:
+            return json.dumps(data, indent=indent)
+        else:
+            return json.dumps(data, separators=(',', ':'))
+
+    def loads(self, string):
+        "Return the data for the JSON string. Raise ValueError if invalid."
+        return json.loads(string)
+
+
+class UjsonCodec(Codec):
+    """JSON codec using the 'ujson' package. Indented output is
+    produced by the standard library, which lays it out better.
+    Integers too large for ujson, and any input it rejects, are handled
+    by the standard library. Note that ujson outputs byte strings
+    as they are, even if they are not valid UTF-8.
+    """
+
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def dumps(self, data, indent=None):
+        if indent:
+            return super(UjsonCodec, self).dumps(data, indent=indent)
+        try:
+            return self.ujson.dumps(data, escape_forward_slashes=False)
+        except OverflowError:
+            return super(UjsonCodec, self).dumps(data)
+
+    def loads(self, string):
+        try:
+            return self.ujson.loads(string)
+        except (OverflowError, ValueError):
+            return super(UjsonCodec, self).loads(string)
+
+
+def add_codec(klass):
+    "Add the codec class to the registry, replacing any of the same name."
+    assert issubclass(klass, Codec)
+    assert klass.name
+    CODECS[klass.name] = klass
+
+add_codec(Codec)
+add_codec(UjsonCodec)
+
+
+def set_codec(name):
+    """Use the codec of the given name.
+    Raise KeyError if no such codec, or ImportError if not available.
+    """
+    global _codec
+    try:
+        klass = CODECS[name]
+    except KeyError:
+        raise KeyError("no JSON codec '%s'" % name)
+    _codec = klass()
+
+def get_codec():
+    "Return the codec in use; the standard library one, unless chosen."
+    global _codec
+    if _codec is None:
+        _codec = Codec()
+    return _codec
+
+def dumps(data, indent=None):
+    "Return the JSON string for the data; compact if no indent."
+    return (_codec or get_codec()).dumps(data, indent=indent)
+
+def loads(string):
+    "Return the data for the JSON string. Raise ValueError if invalid."
+    return (_codec or get_codec()).loads(string)
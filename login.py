@@ -103,13 +103,13 @@ class Login(Method):
             self.redirect = request.get_value('href')
             if not self.redirect: raise KeyError
         except KeyError:
-            self.redirect = request.application.url
+            self.redirect = request.application_url
         # The cookie remedies an apparent deficiency of several
         # human browsers: For some pages in the site (notably
         # the application root '/'), the authentication data
         # does not seem to be sent voluntarily by the browser.
         self.cookie = "%s-login=yes; path=%s" % (appname,
-                                                 request.application.path)
+                                                 request.application_path)
         if self.max_age:
             self.cookie += "; max-age=%s" % self.max_age
 
@@ -13,10 +13,30 @@ DELETE    no        no        no
 """
 
 import logging
+import hashlib
 
 from .fields import *
 from .responses import *
 from . import mimeparse
+from . import compression
+from .utils import url_build
+
+
+SAFE_METHODS = ('GET', 'HEAD')          # Responses have ETag
+
+
+def etag_matches(if_none_match, etag):
+    """Does the value of an 'If-None-Match' header match the ETag?
+    The value '*' matches any ETag, but not None; i.e. only if there
+    is a current representation of the resource.
+    """
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*': return etag is not None
+        if tag.startswith('W/'):        # Weak comparison is allowed
+            tag = tag[2:]
+        if etag and compression.strip_etag(tag) == etag: return True
+    return False
 
 
 class Method(object):
@@ -29,12 +49,17 @@ class Method(object):
         Raise an HTTP error if there is a problem.
         Any other exception is considered a server failure.
         """
-        self.prepare(request)
+        with request.timing('prepare'):
+            self.prepare(request)
         try:
-            self.process(request)
+            if request.http_method not in SAFE_METHODS:
+                self.check_if_none_match(request)
+            with request.timing('process'):
+                self.process(request)
             return self.get_response(request)
         finally:
-            self.finalize()
+            with request.timing('finalize'):
+                self.finalize()
 
     def prepare(self, request):
         """Perform preparatory actions, e.g. login, or database connect.
@@ -49,6 +74,24 @@ class Method(object):
         """
         pass
 
+    def check_if_none_match(self, request):
+        """Raise HTTP_PRECONDITION_FAILED if 'If-None-Match' matches
+        the ETag of the current state of the resource, or is '*' and
+        there is a current state, i.e. 'get_etag' does not return None.
+        Called before 'process' for the methods which may modify the
+        resource.
+        """
+        if_none_match = request.headers['If-None-Match']
+        if not if_none_match: return
+        if etag_matches(if_none_match, self.get_etag(request)):
+            raise HTTP_PRECONDITION_FAILED
+
+    def get_etag(self, request):
+        """Return the ETag for the current state of the resource,
+        or None if not known. Not defined by default.
+        """
+        return None
+
     def get_response(self, request):
         "Return the response instance."
         raise NotImplementedError
@@ -110,16 +153,83 @@ class OutreprsMethodMixin(object):
     "Mixin class providing outgoing representation functions."
 
     outreprs = []                     # List of Representation classes
+    etag     = True                   # Set ETag computed from the body?
 
     def get_response(self, request):
         """Return the response instance.
         First collect the data required for the representation.
         Then decide which representation to use.
         Lastly return the response from the representation given the data.
+        If the method defines a version for the resource, then the
+        representation is decided first, and the ETag computed from the
+        version is checked before any data is collected.
+        Raise HTTP_NOT_MODIFIED if the ETag matches 'If-None-Match'.
+        The ETag is set and checked only for GET and HEAD.
+        """
+        safe = request.http_method in SAFE_METHODS
+        if safe:
+            version = self.get_version(request)
+        else:
+            version = None
+        if version is None:
+            with request.timing('data'):
+                data = self.get_data(request)
+            with request.timing('outrepr'):
+                outrepr = self.get_outrepr(request)
+            with request.timing('representation'):
+                response = outrepr(data)
+            if self.etag and safe:
+                self.check_etag(request, self.set_etag_body(response))
+        else:
+            with request.timing('outrepr'):
+                outrepr = self.get_outrepr(request)
+            etag = self.get_version_etag(version, outrepr)
+            self.check_etag(request, etag)
+            with request.timing('data'):
+                data = self.get_data(request)
+            with request.timing('representation'):
+                response = outrepr(data)
+            response['ETag'] = etag
+        return response
+
+    def get_version(self, request):
+        """Return a version identifier for the current state of the
+        resource, or None if not defined. It must change whenever
+        the data for the response changes. Called before 'get_data'.
+        Not defined by default.
         """
-        data = self.get_data(request)
-        outrepr = self.get_outrepr(request)
-        return outrepr(data)
+        return None
+
+    def get_etag(self, request):
+        "Return the ETag computed from the version, if defined, else None."
+        version = self.get_version(request)
+        if version is None: return None
+        return self.get_version_etag(version, self.get_outrepr(request))
+
+    def get_version_etag(self, version, outrepr):
+        "Return the ETag for the version and the outgoing representation."
+        return '"%s"' % hashlib.sha1(repr((version,
+                                           outrepr.__class__.__name__)))\
+                               .hexdigest()
+
+    def set_etag_body(self, response):
+        """Set the ETag of the response from a hash of its body,
+        if the body is in memory. Return the ETag, or None if not set.
+        """
+        if not response.buffered: return None
+        body = ''.join(response)
+        response.content = [body]
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        response['ETag'] = etag
+        return etag
+
+    def check_etag(self, request, etag):
+        "Raise HTTP_NOT_MODIFIED if the ETag matches 'If-None-Match'."
+        if not etag: return
+        if_none_match = request.headers['If-None-Match']
+        if not if_none_match: return
+        if etag_matches(if_none_match, etag):
+            raise HTTP_NOT_MODIFIED(ETag=etag)
 
     def get_data(self, request):
         "Return the response data dictionary."
@@ -135,7 +245,7 @@ class OutreprsMethodMixin(object):
         "Return the general response data dictionary."
         data = dict(application=dict(name=request.application.name,
                                      version=request.application.version,
-                                     href=request.application.url,
+                                     href=request.application_url,
                                      host=request.application.host),
                     title="%s %s" % (request.application.name,
                                      request.application.version),
@@ -147,7 +257,7 @@ class OutreprsMethodMixin(object):
             pass
         if hasattr(self, 'set_login'):
             # Note: Assumption!
-            data['login_href'] = request.application.get_url('login')
+            data['login_href'] = url_build(request.application_url, 'login')
         return data
 
     def get_data_links(self, request):
@@ -165,7 +275,7 @@ class OutreprsMethodMixin(object):
     def get_data_outreprs(self, request):
         "Return the outrepr links data."
         url = request.url
-        if url == request.application.url:
+        if url == request.application_url:
             url += '/'
         outreprs = []
         for outrepr in self.outreprs:
@@ -184,6 +294,12 @@ class OutreprsMethodMixin(object):
         to determine which outgoing representation to use.
         At least one outgoing representation must be defined.
         """
+        outrepr = self.get_outrepr_class(request)()
+        outrepr.human_user_agent = request.human_user_agent
+        return outrepr
+
+    def get_outrepr_class(self, request):
+        "Return the outgoing representation class; see 'get_outrepr'."
         if not self.outreprs:
             raise HTTP_NOT_ACCEPTABLE            
         # Hard request for output representation
@@ -192,7 +308,7 @@ class OutreprsMethodMixin(object):
             format = format.lstrip('.')
             for outrepr in self.outreprs:
                 if format == outrepr.format:
-                    return outrepr()
+                    return outrepr
             else:
                 raise HTTP_NOT_ACCEPTABLE
         # Output representation content negotiation
@@ -204,9 +320,9 @@ class OutreprsMethodMixin(object):
                 raise HTTP_NOT_ACCEPTABLE            
             for outrepr in self.outreprs:
                 if mimetype == outrepr.mimetype:
-                    return outrepr()
+                    return outrepr
         # Fallback: choose the last; considered the most desirable
-        return self.outreprs[-1]()
+        return self.outreprs[-1]
 
 
 class GET(FieldsMethodMixin, OutreprsMethodMixin, Method):
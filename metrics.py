@@ -0,0 +1,185 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+In-process request metrics: counts, status codes and latency histograms
+per resource name and HTTP method, and a method class serving them
+in the Prometheus text exposition format.
+
+    application = Application(metrics=Metrics())
+    application.add_resource('/metrics', name='Metrics', GET=GET_Metrics)
+"""
+
+import threading
+import bisect
+
+from .methods import *
+from .utils import HTTP_METHODS
+
+
+class Metrics(object):
+    """Collector of request metrics. Each thread records into its own
+    dictionary, so no lock is needed per request; the dictionaries of
+    all threads are merged when a snapshot is taken. The dictionary of
+    a thread which has ended is merged into a retired total, so that
+    the number of dictionaries does not grow with the number of threads
+    ever started.
+    """
+
+    # Upper bounds (seconds) of the latency histogram buckets.
+    BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+               0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+    QUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()    # For registering a thread, merging
+        self.stores = []                # List of (thread, dictionary)
+        self.retired = dict()           # Merged from threads ended
+
+    def get_store(self):
+        "Return the dictionary of statistics for the calling thread."
+        try:
+            return self.local.store
+        except AttributeError:
+            store = self.local.store = dict()
+            with self.lock:
+                self.retire_stores()
+                self.stores.append((threading.current_thread(), store))
+            return store
+
+    def retire_stores(self):
+        """Merge the dictionaries of the threads which have ended into
+        the retired total, and drop them. Must be called with the lock.
+        """
+        alive = []
+        for thread, store in self.stores:
+            if thread.is_alive():
+                alive.append((thread, store))
+            else:
+                self.add_store(self.retired, store)
+        self.stores = alive
+
+    def add_store(self, total, store):
+        "Add the statistics in the dictionary to those in the total."
+        for key, stats in store.items():
+            try:
+                total[key].add(stats)
+            except KeyError:
+                total[key] = _Stats(len(self.BUCKETS) + 1)
+                total[key].add(stats)
+
+    def record(self, name, http_method, http_code, seconds):
+        "Record a request for the resource name and HTTP method."
+        if http_method not in HTTP_METHODS: # Avoid unbounded set of keys
+            http_method = 'other'
+        store = self.get_store()
+        try:
+            stats = store[(name, http_method)]
+        except KeyError:
+            stats = store[(name, http_method)] = _Stats(len(self.BUCKETS) + 1)
+        stats.count += 1
+        stats.sum += seconds
+        stats.codes[http_code] = stats.codes.get(http_code, 0) + 1
+        stats.buckets[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+
+    def get_snapshot(self):
+        """Return a dictionary with key (name, http_method) and
+        the statistics for it summed over all threads.
+        """
+        result = dict()
+        with self.lock:
+            self.retire_stores()
+            self.add_store(result, self.retired)
+            stores = [store for thread, store in self.stores]
+        for store in stores:
+            self.add_store(result, store)
+        return result
+
+    def get_quantile(self, stats, quantile):
+        """Estimate the latency quantile from the histogram, interpolating
+        linearly within the bucket. Return None if no requests.
+        """
+        if not stats.count: return None
+        rank = quantile * stats.count
+        cumulative = 0
+        lower = 0.0
+        for pos, count in enumerate(stats.buckets):
+            if pos < len(self.BUCKETS):
+                upper = self.BUCKETS[pos]
+            else:                       # Overflow bucket; no upper bound
+                return lower
+            if count and cumulative + count >= rank:
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper
+        return lower
+
+    def get_text(self):
+        "Return the metrics in the Prometheus text exposition format."
+        lines = ['# TYPE wrapid_requests_total counter',
+                 '# TYPE wrapid_responses_total counter',
+                 '# TYPE wrapid_request_seconds histogram',
+                 '# TYPE wrapid_request_seconds_quantile gauge']
+        snapshot = self.get_snapshot()
+        for (name, http_method), stats in sorted(snapshot.items()):
+            labels = 'resource="%s",method="%s"' % \
+                     (str(name or '').replace('\\', '\\\\').replace('"', '\\"'),
+                      http_method)
+            lines.append("wrapid_requests_total{%s} %s" % (labels,stats.count))
+            for code, count in sorted(stats.codes.items()):
+                lines.append('wrapid_responses_total{%s,status="%s"} %s'
+                             % (labels, code, count))
+            cumulative = 0
+            for pos, count in enumerate(stats.buckets):
+                cumulative += count
+                try:
+                    le = repr(self.BUCKETS[pos])
+                except IndexError:
+                    le = '+Inf'
+                lines.append('wrapid_request_seconds_bucket{%s,le="%s"} %s'
+                             % (labels, le, cumulative))
+            lines.append("wrapid_request_seconds_sum{%s} %.6f"
+                         % (labels, stats.sum))
+            lines.append("wrapid_request_seconds_count{%s} %s"
+                         % (labels, stats.count))
+            for quantile in self.QUANTILES:
+                lines.append('wrapid_request_seconds_quantile{%s,quantile="%s"}'
+                             ' %.6f' % (labels, quantile,
+                                        self.get_quantile(stats, quantile)))
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class _Stats(object):
+    "Statistics for a resource name and HTTP method."
+
+    def __init__(self, nbuckets):
+        self.count = 0
+        self.sum = 0.0
+        self.codes = dict()
+        self.buckets = [0] * nbuckets
+
+    def add(self, other):
+        "Add the statistics from another instance."
+        self.count += other.count
+        self.sum += other.sum
+        for code, count in other.codes.items():
+            self.codes[code] = self.codes.get(code, 0) + count
+        for pos, count in enumerate(other.buckets):
+            self.buckets[pos] += count
+
+
+class GET_Metrics(GET):
+    """Return the request metrics of the application, as plain text
+    in the Prometheus text exposition format. The metrics are collected
+    only if the application has a Metrics instance as attribute 'metrics'.
+    Access is not restricted; use LoginMixin in an inheriting class,
+    or restrict access in the web server, if required.
+    """
+
+    def get_response(self, request):
+        metrics = request.application.metrics
+        if metrics is None:
+            raise HTTP_NOT_FOUND('no metrics collected')
+        response = HTTP_OK(content_type='text/plain; version=0.0.4')
+        response.append(metrics.get_text())
+        return response
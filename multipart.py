@@ -0,0 +1,261 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+Streaming parser for multipart/form-data input. The body is read in
+blocks, and the content of each part is kept in memory until it exceeds
+the spool size, after which it is written to a temporary file. Memory
+use is therefore bounded regardless of the size of uploaded files.
+
+The size of the body, of each ordinary field and of each file are
+checked as the body is read, and HTTP_REQUEST_ENTITY_TOO_LARGE is raised
+as soon as a limit is exceeded.
+
+The result is a Fields instance, which has the dictionary-style
+interface of cgi.FieldStorage used by Request and the Field classes.
+"""
+
+import cgi
+import tempfile
+import cStringIO
+
+from .responses import HTTP_BAD_REQUEST, HTTP_REQUEST_ENTITY_TOO_LARGE
+
+
+BLOCK_SIZE       = 65536
+MAX_HEADERS_SIZE = 16384                # Bytes; headers of a part
+
+
+class Part(object):
+    """A part of multipart/form-data input: an ordinary field,
+    or a file if 'filename' is not None. The content is available
+    as the file-like object 'file', positioned at its start, and
+    as the string 'value'. If the content was spooled to disk,
+    then 'path' is the name of the temporary file, else None.
+    The temporary file is removed when the part is closed,
+    or garbage collected.
+    """
+
+    def __init__(self, headers, spool_size=BLOCK_SIZE, spool_dirpath=None):
+        self.headers = headers
+        disposition = headers.get('content-disposition', '')
+        disposition, params = cgi.parse_header(disposition)
+        if disposition != 'form-data' or 'name' not in params:
+            raise HTTP_BAD_REQUEST('invalid multipart Content-Disposition')
+        self.name = params['name']
+        self.filename = params.get('filename')
+        self.type = headers.get('content-type',
+                                self.filename is None and 'text/plain'
+                                or 'application/octet-stream')
+        self.spool_size = spool_size
+        self.spool_dirpath = spool_dirpath
+        self.size = 0
+        self.file = cStringIO.StringIO()
+
+    def __repr__(self):
+        return "%s(%r, %r)" % (self.__class__.__name__, self.name, self.filename)
+
+    @property
+    def path(self):
+        "The name of the temporary file, if spooled to disk, else None."
+        return getattr(self.file, 'name', None)
+
+    @property
+    def value(self):
+        "The content as a string. Reads the file if spooled to disk."
+        if self.path is None:
+            return self.file.getvalue()
+        position = self.file.tell()
+        self.file.seek(0)
+        try:
+            return self.file.read()
+        finally:
+            self.file.seek(position)
+
+    def write(self, data):
+        "Append the data to the content, spooling it to disk if large."
+        self.size += len(data)
+        if self.path is None and self.size > self.spool_size:
+            spooled = tempfile.NamedTemporaryFile(prefix='wrapid-',
+                                                  dir=self.spool_dirpath)
+            spooled.write(self.file.getvalue())
+            self.file = spooled
+        self.file.write(data)
+
+    def done(self):
+        "All content has been written."
+        self.file.flush()
+        self.file.seek(0)
+
+    def close(self):
+        self.file.close()
+
+
+class Fields(object):
+    """The parts of multipart/form-data input, with the dictionary-style
+    interface of cgi.FieldStorage.
+    """
+
+    def __init__(self, parts):
+        self.list = parts
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.list)
+
+    def __nonzero__(self):
+        return bool(self.list)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        for part in self.list:
+            if part.name == key: return True
+        return False
+
+    has_key = __contains__
+
+    def __getitem__(self, key):
+        "Return the part, or the list of parts if more than one."
+        found = [p for p in self.list if p.name == key]
+        if not found:
+            raise KeyError(key)
+        if len(found) == 1:
+            return found[0]
+        else:
+            return found
+
+    def keys(self):
+        return list(set([p.name for p in self.list]))
+
+    def getvalue(self, key, default=None):
+        "Return the value, or list of values, for the name."
+        try:
+            found = self[key]
+        except KeyError:
+            return default
+        if isinstance(found, list):
+            return [p.value for p in found]
+        else:
+            return found.value
+
+    def getfirst(self, key, default=None):
+        for part in self.list:
+            if part.name == key: return part.value
+        return default
+
+    def getlist(self, key):
+        return [p.value for p in self.list if p.name == key]
+
+    def close(self):
+        "Close all parts, removing any temporary files."
+        for part in self.list:
+            part.close()
+
+
+def parse(fp, boundary, content_length=None,
+          max_size=None, max_field_size=None, max_file_size=None,
+          spool_size=BLOCK_SIZE, spool_dirpath=None):
+    """Parse the multipart/form-data input from the file-like object,
+    reading at most 'content_length' bytes, if given.
+    Return a Fields instance.
+    Raise HTTP_REQUEST_ENTITY_TOO_LARGE if the size of the input exceeds
+    'max_size', or the size of an ordinary field 'max_field_size',
+    or the size of a file 'max_file_size'; a limit None means no limit.
+    Raise HTTP_BAD_REQUEST if the input is invalid.
+    """
+    if boundary and boundary[0] == boundary[-1] == '"':
+        boundary = boundary[1:-1]
+    if not boundary or len(boundary) > 70:
+        raise HTTP_BAD_REQUEST('invalid multipart boundary')
+    if max_size is not None and content_length is not None \
+       and content_length > max_size:
+        raise HTTP_REQUEST_ENTITY_TOO_LARGE
+    delimiter = '--' + boundary
+    separator = '\r\n' + delimiter
+    keep = len(separator) + 1           # Tail which may hold a separator
+    remaining = content_length
+    total = 0
+    buffer = ''
+    parts = []
+    part = None
+    limit = None
+    state = 'preamble'
+    try:
+        while True:
+            if state == 'preamble':
+                pos = buffer.find(delimiter)
+                if pos >= 0:
+                    buffer = buffer[pos + len(delimiter):]
+                    state = 'delimiter'
+                    continue
+                buffer = buffer[-len(delimiter):] # Discard the preamble
+            elif state == 'delimiter':
+                if len(buffer) >= 2:
+                    if buffer.startswith('--'):
+                        break
+                    buffer = buffer.lstrip(' \t')
+                    if buffer.startswith('\r\n'):
+                        buffer = buffer[2:]
+                        state = 'headers'
+                        continue
+                    if len(buffer) >= 2:
+                        raise HTTP_BAD_REQUEST('invalid multipart delimiter')
+            elif state == 'headers':
+                pos = buffer.find('\r\n\r\n')
+                if pos >= 0:
+                    headers = dict()
+                    for line in buffer[:pos].split('\r\n'):
+                        name, sep, value = line.partition(':')
+                        if not sep:
+                            raise HTTP_BAD_REQUEST('invalid multipart header')
+                        headers[name.strip().lower()] = value.strip()
+                    buffer = buffer[pos + 4:]
+                    part = Part(headers,
+                                spool_size=spool_size,
+                                spool_dirpath=spool_dirpath)
+                    parts.append(part)
+                    if part.filename is None:
+                        limit = max_field_size
+                    else:
+                        limit = max_file_size
+                    state = 'content'
+                    continue
+                if len(buffer) > MAX_HEADERS_SIZE:
+                    raise HTTP_BAD_REQUEST('too large multipart headers')
+            elif state == 'content':
+                pos = buffer.find(separator)
+                if pos >= 0:
+                    data = buffer[:pos]
+                    buffer = buffer[pos + len(separator):]
+                    state = 'delimiter'
+                elif len(buffer) > keep:
+                    data = buffer[:-keep]
+                    buffer = buffer[-keep:]
+                else:
+                    data = ''
+                if data:
+                    if limit is not None and part.size + len(data) > limit:
+                        raise HTTP_REQUEST_ENTITY_TOO_LARGE(
+                            "too large value for '%s'" % part.name)
+                    part.write(data)
+                if state == 'delimiter':
+                    part.done()
+                    continue
+            # Read more input.
+            if remaining is None:
+                block = fp.read(BLOCK_SIZE)
+            elif remaining > 0:
+                block = fp.read(min(BLOCK_SIZE, remaining))
+                remaining -= len(block)
+            else:
+                block = ''
+            if not block:
+                raise HTTP_BAD_REQUEST('incomplete multipart input')
+            total += len(block)
+            if max_size is not None and total > max_size:
+                raise HTTP_REQUEST_ENTITY_TOO_LARGE
+            buffer += block
+    except Exception:
+        for part in parts:
+            part.close()
+        raise
+    return Fields(parts)
@@ -0,0 +1,32 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+Newline-delimited JSON representation, for bulk output of collections.
+"""
+
+from .representation import *
+from . import jsoncodec
+
+
+class NdjsonRepresentation(Representation):
+    """Newline-delimited JSON representation of the rows of the resource;
+    one JSON document per line. The rows are the list or iterator which
+    is the entry 'rows_key' of the data dictionary. They are encoded
+    as they are obtained, and streamed to the client.
+    """
+
+    mimetype = 'application/x-ndjson'
+    charset = 'utf-8'
+    format = 'ndjson'
+    rows_key = 'rows'
+
+    def __call__(self, data):
+        response = HTTP_OK(**self.get_http_headers())
+        response.buffered = False
+        response.content = self.coalesce(self.iterencode(data))
+        return response
+
+    def iterencode(self, data):
+        "Yield the line for each row."
+        dumps = jsoncodec.dumps
+        for row in data.get(self.rows_key) or []:
+            yield dumps(row) + '\n'
@@ -15,6 +15,8 @@ class Representation(object):
     format = None
     charset = None
     cache_control = 'max-age=3600'
+    human_user_agent = True             # Set from the request, if any
+    buffer_size = 65536                 # Bytes; chunks of streamed body
 
     def __init__(self, descr=None):
         assert self.mimetype
@@ -51,3 +53,31 @@ class Representation(object):
     def __call__(self, data):
         "Return the response instance containing the representation."
         raise NotImplementedError
+
+    def coalesce(self, chunks):
+        """Join the chunks of a streamed body into strings
+        of at least 'buffer_size' bytes.
+        """
+        buffer = []
+        size = 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= self.buffer_size:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield ''.join(buffer)
+
+    def has_iterator(self, data):
+        "Is any entry in the data dictionary an iterator?"
+        if not isinstance(data, dict): return False
+        for value in data.itervalues():
+            if is_iterator(value): return True
+        return False
+
+
+def is_iterator(value):
+    "Is the value a generator, or some other iterator?"
+    return hasattr(value, 'next') and hasattr(value, '__iter__')
@@ -4,14 +4,18 @@ Request class: data container for a single request.
 """
 
 import logging
+import contextlib
 import cgi
-import json
+import cStringIO
 import Cookie
 import wsgiref.util
 import wsgiref.headers
 
 from . import mimeparse
-from .utils import url_build
+from . import multipart
+from . import jsoncodec
+from .responses import HTTP_BAD_REQUEST, HTTP_REQUEST_ENTITY_TOO_LARGE
+from .utils import url_build, timer, cached_property
 
 
 class Request(object):
@@ -21,32 +25,48 @@ class Request(object):
     HUMAN_USER_AGENT_SIGNATURES = ['mozilla', 'firefox', 'opera',
                                    'chrome', 'safari', 'msie']
 
+    READ_SIZE = 65536                   # Bytes; input of unknown length
+
+    # Limits for the input; None means no limit. The application sets
+    # 'max_body_size' from that of the resource, or its own.
+    max_body_size  = None               # Bytes
+    max_field_size = 2**20              # Bytes; ordinary multipart field
+    max_file_size  = None               # Bytes; multipart file
+    # Multipart parts larger than this are spooled to a temporary file.
+    spool_size     = 2**16              # Bytes
+    spool_dirpath  = None               # Directory; default the system's
+
     def __init__(self, environ):
-        "Standard setup of attributes from the HTTP input data."
-        self.environ = environ.copy()
-        self.url = wsgiref.util.request_uri(self.environ, include_query=False)
-        self.urlpath = self.environ['PATH_INFO']
-        self.http_method = self.environ['REQUEST_METHOD']
+        """Standard setup of attributes from the HTTP input data.
+        The headers, cookie, fields of a GET request, and the guess
+        whether the user agent is human, are obtained on first access.
+        The input is not read until 'handle_input' is called.
+        """
+        self.time_start = timer()
+        self.timings = []               # List of (name, seconds)
+        self.environ = environ          # Not copied; do not modify
+        self.url = wsgiref.util.request_uri(environ, include_query=False)
+        self.urlpath = environ['PATH_INFO']
+        self.http_method = environ['REQUEST_METHOD']
         self.name = None
         self.variables = dict()
-        self.human_user_agent = self.is_human_user_agent()
-        # Obtain the HTTP headers for the request.
-        self.headers = wsgiref.headers.Headers([])
-        for key, value in self.environ.iteritems():
-            if key.startswith('HTTP_'):
-                name = '-'.join([p.capitalize() for p in key[5:].split('_')])
-                self.headers[name] = str(value)
-        # Obtain the SimpleCookie instance for the request.
-        self.cookie = Cookie.SimpleCookie(self.environ.get('HTTP_COOKIE'))
-        # Input: Handle according to content type and HTTP request method
+        # Set by the application.
+        self.application_url = None
+        self.application_path = None
+        # Input: Set by 'handle_input'.
         self.content_type = None
         self.content_type_params = dict()
-        self.fields = cgi.FieldStorage() # Input parsed into CGI fields
         self.json = None                 # Input after JSON decoding
         self.data = None                 # Input as raw data
-        if self.http_method == 'GET':
-            self.handle_cgi_input()
-        elif self.http_method == 'POST':
+
+    def handle_input(self):
+        """Read and parse the input according to content type and
+        HTTP request method. Called by the application when the
+        resource has been found.
+        Raise HTTP_BAD_REQUEST if the input is invalid, or
+        HTTP_REQUEST_ENTITY_TOO_LARGE if it exceeds a limit.
+        """
+        if self.http_method == 'POST':
             self.handle_typed_input()
             # Allow override of HTTP method
             try:
@@ -55,11 +75,50 @@ class Request(object):
                 http_method = http_method.strip()
                 if not http_method: raise KeyError
                 self.http_method = http_method
-            except KeyError:
+            except (KeyError, TypeError): # TypeError: JSON input not a dict
                 pass
         elif self.http_method == 'PUT':
             self.handle_typed_input()
 
+    @cached_property
+    def headers(self):
+        "The HTTP headers for the request."
+        headers = wsgiref.headers.Headers([])
+        for key, value in self.environ.iteritems():
+            if key.startswith('HTTP_'):
+                name = '-'.join([p.capitalize() for p in key[5:].split('_')])
+                headers[name] = str(value)
+        return headers
+
+    @cached_property
+    def cookie(self):
+        "The SimpleCookie instance for the request."
+        return Cookie.SimpleCookie(self.environ.get('HTTP_COOKIE'))
+
+    @cached_property
+    def human_user_agent(self):
+        "Is the user agent a human, i.e. a browser? A guess."
+        return self.is_human_user_agent()
+
+    @cached_property
+    def fields(self):
+        """Input parsed into CGI fields; from the query for a GET request.
+        Set when the input of a POST or PUT request is a form.
+        """
+        if self.environ['REQUEST_METHOD'] == 'GET':
+            return cgi.FieldStorage(environ=self.environ)
+        else:
+            return cgi.FieldStorage()
+
+    @contextlib.contextmanager
+    def timing(self, name):
+        "Context manager recording the time taken by the block, by name."
+        start = timer()
+        try:
+            yield
+        finally:
+            self.timings.append((name, timer() - start))
+
     def remove_format_url(self):
         "Remove the format part of the URL, if any."
         format = self.variables.get('FORMAT')
@@ -87,10 +146,51 @@ class Request(object):
                     return True
         return False
 
-    def handle_cgi_input(self):
-        self.fields = cgi.FieldStorage(environ=self.environ)
+    @property
+    def content_length(self):
+        "The length of the input, or None if not given."
+        try:
+            return int(self.environ['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return None
+
+    def check_content_length(self):
+        """Raise HTTP_REQUEST_ENTITY_TOO_LARGE if the length of the input
+        is given, and exceeds the limit.
+        """
+        length = self.content_length
+        if self.max_body_size is not None and length is not None and \
+           length > self.max_body_size:
+            raise HTTP_REQUEST_ENTITY_TOO_LARGE("input larger than %s bytes"
+                                                % self.max_body_size)
+
+    def read_input(self):
+        """Return the input as a string. If the length is not given,
+        e.g. for chunked input, then read no more than the limit.
+        Raise HTTP_REQUEST_ENTITY_TOO_LARGE if the input exceeds the limit.
+        """
+        self.check_content_length()
+        input = self.environ['wsgi.input']
+        length = self.content_length
+        if length is not None:
+            return input.read(length)
+        limit = self.max_body_size
+        if limit is None:
+            return input.read()
+        chunks = []
+        size = 0
+        while True:
+            chunk = input.read(min(self.READ_SIZE, limit + 1 - size))
+            if not chunk: break
+            size += len(chunk)
+            if size > limit:
+                raise HTTP_REQUEST_ENTITY_TOO_LARGE("input larger than %s"
+                                                    " bytes" % limit)
+            chunks.append(chunk)
+        return ''.join(chunks)
 
     def handle_typed_input(self):
+        self.check_content_length()
         try:
             content_type = self.environ['CONTENT_TYPE']
         except KeyError:
@@ -99,17 +199,34 @@ class Request(object):
         self.content_type = "%s/%s" % content_type[0:2]
         logging.debug("wrapid: incoming content type: %s", self.content_type)
         self.content_type_params = content_type[2]
-        if self.content_type in ('application/x-www-form-urlencoded',
-                                 'multipart/form-data'):
-            self.fields = cgi.FieldStorage(fp=self.environ['wsgi.input'],
-                                           environ=self.environ)
+        if self.content_type == 'multipart/form-data':
+            boundary = self.content_type_params.get('boundary')
+            self.fields = multipart.parse(self.environ['wsgi.input'],
+                                          boundary,
+                                          content_length=self.content_length,
+                                          max_size=self.max_body_size,
+                                          max_field_size=self.max_field_size,
+                                          max_file_size=self.max_file_size,
+                                          spool_size=self.spool_size,
+                                          spool_dirpath=self.spool_dirpath)
+        elif self.content_type == 'application/x-www-form-urlencoded':
+            input = cStringIO.StringIO(self.read_input())
+            self.fields = cgi.FieldStorage(fp=input, environ=self.environ)
         elif self.content_type == 'application/json':
             try:
-                self.json = json.loads(self.environ['wsgi.input'].read())
+                self.json = jsoncodec.loads(self.read_input())
             except ValueError:
                 raise HTTP_BAD_REQUEST('invalid JSON')
         else:
-            self.data = self.environ['wsgi.input'].read()
+            self.data = self.read_input()
+
+    def close(self):
+        """Close the multipart input fields, if any, removing any temporary
+        files. Called by the application when the response has been produced.
+        """
+        fields = self.__dict__.get('fields') # Do not parse on access here
+        if hasattr(fields, 'close'):
+            fields.close()
 
     def get_value(self, name):
         """Return the input item value by name.
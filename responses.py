@@ -5,6 +5,7 @@ HTTP response classes.
 
 import sys
 import httplib
+import itertools
 import wsgiref.headers
 
 
@@ -12,6 +13,7 @@ class Response(Exception):
     "Base class for HTTP responses."
 
     http_code = None
+    buffered  = True                    # Is the content held in memory?
 
     def __init__(self, *args, **kwargs):
         super(Response, self).__init__(*args)
@@ -31,7 +33,7 @@ class Response(Exception):
         return self
 
     def __iter__(self):
-        return iter(map(str, self.content))
+        return itertools.imap(str, self.content)
 
     def append(self, data):
         self.content.append(data)
@@ -112,6 +114,12 @@ class HTTP_CONFLICT(HTTP_CLIENT_ERROR):
 class HTTP_GONE(HTTP_CLIENT_ERROR):
     http_code = httplib.GONE
 
+class HTTP_PRECONDITION_FAILED(HTTP_CLIENT_ERROR):
+    http_code = httplib.PRECONDITION_FAILED
+
+class HTTP_REQUEST_ENTITY_TOO_LARGE(HTTP_CLIENT_ERROR):
+    http_code = httplib.REQUEST_ENTITY_TOO_LARGE
+
 
 class HTTP_SERVER_ERROR(HTTP_ERROR): pass
 
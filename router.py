@@ -0,0 +1,273 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+Router classes: find the resource matching a URL path.
+
+A router instance is held by the application. Each resource is added
+to it in the order of definition, and the first resource (in that order)
+which matches a URL path is the one returned by 'match'.
+"""
+
+import re
+
+
+class LinearRouter(object):
+    """Try the regular expression of each resource in turn.
+    The cost of a lookup is proportional to the number of resources.
+    """
+
+    def __init__(self):
+        self.resources = []
+
+    def add(self, resource):
+        "Add the resource; it has lower priority than those already added."
+        self.resources.append(resource)
+
+    def match(self, urlpath):
+        """Return the tuple (resource, variables) for the URL path,
+        or None if no resource matches it.
+        """
+        for resource in self.resources:
+            match = resource.match(urlpath)
+            if match:
+                return (resource, match.groupdict())
+        return None
+
+
+class RegexRouter(object):
+    """Fold the regular expressions of all resources into one alternation
+    of named groups, compiled at the first lookup after a resource has
+    been added. Regexp alternation tries the alternatives from left
+    to right, so the priority order is the same as for LinearRouter.
+    """
+
+    # The 're' module of Python 2 allows at most 99 capturing groups
+    # in a pattern; larger sets are split into several patterns.
+    MAX_GROUPS = 99
+    GROUP_RX = re.compile(r'\(\?P([<=])(\w+)([>)])')
+
+    def __init__(self):
+        self.resources = []
+        self.patterns = None
+
+    def add(self, resource):
+        "Add the resource; it has lower priority than those already added."
+        self.resources.append(resource)
+        self.patterns = None            # Invalidate; rebuild at next match
+
+    def compile(self):
+        """Compile and return the combined patterns. Each resource gets
+        an outer group named by its index, and its variable groups
+        are prefixed by it.
+        """
+        patterns = []
+        alternatives = []
+        count = 0
+        for index, resource in enumerate(self.resources):
+            prefix = "_%s_" % index
+            pattern = resource.urlpath_rx.pattern
+            pattern = self.GROUP_RX.sub(lambda m: "(?P%s%s%s%s" % (m.group(1),
+                                                                   prefix,
+                                                                   m.group(2),
+                                                                   m.group(3)),
+                                        pattern)
+            alternative = "(?P<_%s>%s)" % (index, pattern)
+            groups = resource.urlpath_rx.groups + 1
+            if alternatives and count + groups > self.MAX_GROUPS:
+                patterns.append(re.compile('|'.join(alternatives)))
+                alternatives = []
+                count = 0
+            alternatives.append(alternative)
+            count += groups
+        if alternatives:
+            patterns.append(re.compile('|'.join(alternatives)))
+        self.patterns = patterns        # Atomic; other threads may be reading
+        return patterns
+
+    def match(self, urlpath):
+        """Return the tuple (resource, variables) for the URL path,
+        or None if no resource matches it.
+        """
+        patterns = self.patterns
+        if patterns is None:
+            patterns = self.compile()
+        for pattern in patterns:
+            match = pattern.match(urlpath)
+            if match:
+                break
+        else:
+            return None
+        index = int(match.lastgroup[1:])
+        prefix = "_%s_" % index
+        variables = dict()
+        for key, value in match.groupdict().iteritems():
+            if key.startswith(prefix):
+                variables[key[len(prefix):]] = value
+        return (self.resources[index], variables)
+
+
+class TrieRouter(object):
+    """Segment trie compiled from the URL templates of the resources.
+    Literal segments are looked up in a dictionary, variable segments
+    are matched by their typed regular expression, so a lookup only
+    visits the branches which may match the URL path. The priority
+    order of the resources is the same as for LinearRouter.
+    """
+
+    # A segment which contains any of these is not a plain literal.
+    REGEXP_CHARS = set('.^$*+?()[]{}|\\')
+    FORMAT_RX = re.compile(r'^\.\w{1,6}$')
+
+    def __init__(self):
+        self.count = 0
+        self.root = _Node()
+        self.fallback = []              # Resources matched by their regexp
+
+    def add(self, resource):
+        "Add the resource; it has lower priority than those already added."
+        index = self.count
+        self.count += 1
+        template = resource.urlpath_template
+        if template in ['', '/']:       # Special cases; see Resource
+            self.fallback.append((index, resource))
+            return
+        node = self.root
+        node.update_index(index)
+        segments = template.split('/')
+        for pos, segment in enumerate(segments):
+            if resource.VARIABLE_RX.search(segment):
+                pattern = resource.VARIABLE_RX.sub(resource.replace_variable,
+                                                   segment)
+                if self.is_path_pattern(resource, segment):
+                    tail = '/'.join(segments[pos:])
+                    tail = resource.VARIABLE_RX.sub(resource.replace_variable,
+                                                    tail)
+                    node.tails.append((index, resource, _Matcher(tail)))
+                    return
+                node = node.get_matcher_child(pattern)
+            elif self.REGEXP_CHARS.intersection(segment):
+                node = node.get_matcher_child(segment)
+            else:
+                node = node.literals.setdefault(segment, _Node())
+            node.update_index(index)
+        node.leaves.append((index, resource))
+
+    def is_path_pattern(self, resource, segment):
+        "Does the template segment contain a variable of type 'path'?"
+        for variable in resource.VARIABLE_RX.findall(segment):
+            if variable.endswith(':path'):
+                return True
+        return False
+
+    def match(self, urlpath):
+        """Return the tuple (resource, variables) for the URL path,
+        or None if no resource matches it.
+        """
+        best = [None, None, None]       # index, resource, variables
+        for index, resource in self.fallback:
+            if best[0] is not None and index >= best[0]: break
+            match = resource.match(urlpath)
+            if match:
+                best[:] = [index, resource, match.groupdict()]
+                break
+        self.search(self.root, urlpath.split('/'), 0, dict(), best)
+        if best[0] is None:
+            return None
+        return (best[1], best[2])
+
+    def search(self, node, segments, pos, variables, best):
+        """Depth-first search of the trie for the highest-priority match.
+        Branches which cannot improve on the best match so far are pruned.
+        """
+        if best[0] is not None and node.min_index >= best[0]:
+            return
+        for index, resource, matcher in node.tails:
+            if best[0] is not None and index >= best[0]: continue
+            found = matcher.match_final('/'.join(segments[pos:]))
+            if found is not None:
+                result = variables.copy()
+                result.update(found)
+                best[:] = [index, resource, result]
+        segment = segments[pos]
+        if pos == len(segments) - 1:    # Last segment; may contain FORMAT
+            child = node.literals.get(segment)
+            if child is not None:
+                self.set_leaf(child, dict(variables, FORMAT=None), best)
+            dot = segment.rfind('.')
+            if dot >= 0 and self.FORMAT_RX.match(segment[dot:]):
+                child = node.literals.get(segment[:dot])
+                if child is not None:
+                    self.set_leaf(child,
+                                  dict(variables, FORMAT=segment[dot:]),
+                                  best)
+            for matcher, child in node.matchers:
+                if not child.leaves: continue
+                found = matcher.match_final(segment)
+                if found is not None:
+                    result = variables.copy()
+                    result.update(found)
+                    self.set_leaf(child, result, best)
+        else:
+            child = node.literals.get(segment)
+            if child is not None:
+                self.search(child, segments, pos+1, variables, best)
+            for matcher, child in node.matchers:
+                found = matcher.match(segment)
+                if found is not None:
+                    result = variables.copy()
+                    result.update(found)
+                    self.search(child, segments, pos+1, result, best)
+
+    def set_leaf(self, node, variables, best):
+        "Record the first resource ending at the node, if higher priority."
+        if not node.leaves: return
+        index, resource = node.leaves[0]
+        if best[0] is None or index < best[0]:
+            best[:] = [index, resource, variables]
+
+
+class _Node(object):
+    "Node in the segment trie."
+
+    def __init__(self):
+        self.min_index = None
+        self.literals = dict()          # Segment string -> _Node
+        self.matchers = []              # List of (_Matcher, _Node)
+        self.leaves = []                # Resources ending at this node
+        self.tails = []                 # Resources with a 'path' variable
+
+    def update_index(self, index):
+        if self.min_index is None or index < self.min_index:
+            self.min_index = index
+
+    def get_matcher_child(self, pattern):
+        "Get the child node for the segment pattern; create if none."
+        for matcher, child in self.matchers:
+            if matcher.pattern == pattern:
+                return child
+        child = _Node()
+        self.matchers.append((_Matcher(pattern), child))
+        return child
+
+
+class _Matcher(object):
+    """Compiled regular expressions for a template segment pattern;
+    one for any inner segment, and one for the final segment,
+    which may have a FORMAT suffix.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.rx = re.compile("^(?:%s)$" % pattern)
+        self.rx_final = re.compile("^(?:%s)(?P<FORMAT>\.\w{1,6})?$" % pattern)
+
+    def match(self, segment):
+        match = self.rx.match(segment)
+        if match:
+            return match.groupdict()
+        return None
+
+    def match_final(self, segment):
+        match = self.rx_final.match(segment)
+        if match:
+            return match.groupdict()
+        return None
@@ -0,0 +1,218 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+Statistical profiler sampling the stacks of the threads handling
+requests, and method classes to control it and obtain its output.
+
+The output is in the collapsed stack format, one line per distinct
+stack with the functions separated by semicolons followed by the count,
+which is the input for flame graph tools.
+
+    application.add_resource('/sampler',
+                             name='Sampler',
+                             GET=GET_Sampler,
+                             POST=POST_Sampler)
+
+Access to the method classes is forbidden unless explicitly allowed;
+see SamplerMethodMixin.
+"""
+
+import sys
+import time
+import threading
+
+from .methods import *
+from .application import Application
+
+
+class Sampler(object):
+    """Background thread sampling the stacks of all threads at regular
+    intervals. Only stacks within Application.handle, i.e. of threads
+    that are handling a request, are counted.
+    """
+
+    interval    = 0.005                 # Seconds between samples
+    max_seconds = 300                   # Stop automatically after this
+
+    HANDLE_CODE = Application.handle.im_func.func_code
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = threading.Event()
+        self.counts = dict()
+        self.labels = dict()            # Key: code object
+        self.samples = 0
+        self.started = None
+        self.stopped = None
+        self.run_interval = None        # Of the current or last run
+
+    @property
+    def running(self):
+        thread = self.thread
+        return thread is not None and thread.isAlive()
+
+    def start(self, interval=None, max_seconds=None):
+        """Start sampling, discarding the previous counts. The interval
+        and max number of seconds apply to this run only; by default
+        those of the sampler. Raise ValueError if already running.
+        """
+        interval = interval or self.interval
+        max_seconds = max_seconds or self.max_seconds
+        with self.lock:
+            if self.running:
+                raise ValueError('sampler is already running')
+            self.run_interval = interval
+            self.counts = dict()
+            self.samples = 0
+            self.started = time.time()
+            self.stopped = None
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run,
+                                           args=(interval, max_seconds),
+                                           name='wrapid-sampler')
+            self.thread.setDaemon(True)
+            self.thread.start()
+
+    def stop(self):
+        "Stop sampling, and wait for the thread to finish."
+        with self.lock:
+            thread = self.thread
+            self.stopping.set()
+        if thread is not None and thread is not threading.currentThread():
+            thread.join()
+
+    def run(self, interval, max_seconds):
+        "Take samples until stopped, or the max number of seconds passed."
+        deadline = self.started + max_seconds
+        try:
+            while not self.stopping.isSet() and time.time() < deadline:
+                self.sample()
+                time.sleep(interval)
+        finally:
+            self.stopped = time.time()
+
+    def sample(self):
+        "Count the stack of each thread which is handling a request."
+        own = threading.currentThread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident == own: continue
+            stack = []
+            handling = False
+            while frame is not None:
+                code = frame.f_code
+                handling = handling or code is self.HANDLE_CODE
+                stack.append(self.get_label(code))
+                frame = frame.f_back
+            if not handling: continue
+            stack.reverse()
+            key = ';'.join(stack)
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def get_label(self, code):
+        "Return the label for the function of the code object."
+        try:
+            return self.labels[code]
+        except KeyError:
+            label = "%s (%s:%s)" % (code.co_name,
+                                    code.co_filename,
+                                    code.co_firstlineno)
+            label = label.replace(';', ':')
+            self.labels[code] = label
+            return label
+
+    def get_collapsed(self):
+        "Return the counts of the stacks in collapsed format."
+        lines = ["%s %s" % item for item in sorted(self.counts.items())]
+        lines.append('')
+        return '\n'.join(lines)
+
+    def get_status(self):
+        "Return a dictionary describing the state of the sampler."
+        return dict(running=self.running,
+                    interval=self.run_interval or self.interval,
+                    samples=self.samples,
+                    stacks=len(self.counts),
+                    started=self.started,
+                    stopped=self.stopped)
+
+
+# The stacks of all threads in the process are sampled,
+# so a single sampler instance suffices.
+SAMPLER = Sampler()
+
+
+class SamplerMethodMixin(object):
+    """Mixin class for the sampler method classes.
+    Access is forbidden by default. It is allowed if 'sampler_allowed'
+    is True, or if the method class also inherits LoginMixin and the
+    login account is a member of any of 'admin_teams'. Redefine
+    'check_access' in an inheriting class to allow access in other
+    circumstances.
+    """
+
+    sampler = SAMPLER
+    sampler_allowed = False             # Allow access to anyone?
+    admin_teams = ['admin']             # Allowed teams, with LoginMixin
+
+    def prepare(self, request):
+        self.check_access(request)
+
+    def check_access(self, request):
+        "Raise HTTP_FORBIDDEN if access to the sampler is not allowed."
+        if self.sampler_allowed: return
+        if hasattr(self, 'set_login'):  # LoginMixin
+            self.set_login(request)
+            teams = (self.login or dict()).get('teams') or []
+            if set(teams).intersection(self.admin_teams): return
+        raise HTTP_FORBIDDEN
+
+    def get_status_text(self):
+        status = self.sampler.get_status()
+        return ''.join(["%s: %s\n" % (key, status[key])
+                        for key in sorted(status)])
+
+
+class GET_Sampler(SamplerMethodMixin, GET):
+    """Return the sampled stacks in collapsed format as plain text.
+    The status of the sampler is given in the HTTP headers.
+    """
+
+    def get_response(self, request):
+        response = HTTP_OK(content_type='text/plain',
+                           X_Sampler_Running=str(self.sampler.running),
+                           X_Sampler_Samples=str(self.sampler.samples))
+        response.append(self.sampler.get_collapsed())
+        return response
+
+
+class POST_Sampler(SamplerMethodMixin, POST):
+    """Start or stop the sampler. Starting discards the stacks sampled
+    previously. Returns the status of the sampler as plain text.
+    """
+
+    fields = (SelectField('action', required=True,
+                          options=['start', 'stop']),
+              FloatField('interval',
+                         descr='Seconds between samples.'),
+              FloatField('max_seconds',
+                         descr='Stop automatically after this many seconds.'))
+
+    def prepare(self, request):
+        super(POST_Sampler, self).prepare(request)
+        self.values = self.parse_fields(request)
+
+    def process(self, request):
+        if self.values['action'] == 'start':
+            try:
+                self.sampler.start(interval=self.values.get('interval'),
+                                   max_seconds=self.values.get('max_seconds'))
+            except ValueError, message:
+                raise HTTP_CONFLICT(str(message))
+        else:
+            self.sampler.stop()
+
+    def get_response(self, request):
+        response = HTTP_OK(content_type='text/plain')
+        response.append(self.get_status_text())
+        return response
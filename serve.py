@@ -0,0 +1,416 @@
+""" wrapid: Micro framework built on Python WSGI for RESTful server APIs
+
+Standalone pre-forking multi-threaded HTTP/1.1 server for a wrapid
+application, or any other WSGI application. For load testing and for
+deployment in containers, where Apache mod_wsgi is not wanted.
+
+    python -m wrapid.serve [options] module:application
+
+The master process forks the worker processes, each of which imports
+the application and handles requests using a pool of threads.
+The workers accept connections from a listening socket shared with
+the master, or, where the platform provides SO_REUSEPORT, from one
+socket per worker. Persistent connections (keep-alive) are supported.
+
+Signals to the master process:
+  HUP        Graceful restart: start new workers, which re-import the
+             application, and stop the old ones after their current
+             requests have been handled.
+  TERM, INT  Graceful shutdown.
+"""
+
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import select
+import logging
+import optparse
+import threading
+import Queue
+import SocketServer
+import wsgiref.simple_server
+
+
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', None)
+
+
+class ServerHandler(wsgiref.simple_server.ServerHandler):
+    """Handler for the WSGI application call of a single request.
+    Uses chunked transfer encoding when the length of the response body
+    is not known and the client understands HTTP/1.1, so that the
+    connection can be kept alive. The body of a response to HEAD
+    is not sent.
+    """
+
+    http_version = '1.1'
+    chunked = False
+
+    def cleanup_headers(self):
+        wsgiref.simple_server.ServerHandler.cleanup_headers(self)
+        if 'Content-Length' in self.headers: return
+        code = self.status.split(' ', 1)[0]
+        if code in ('204', '304') or code.startswith('1'): return
+        if self.request_handler.command == 'HEAD': return
+        if self.request_handler.request_version != 'HTTP/1.1':
+            self.request_handler.close_connection = 1
+            return
+        self.headers['Transfer-Encoding'] = 'chunked'
+        self.chunked = True
+
+    def write(self, data):
+        assert type(data) is str, 'write() argument must be string'
+        if not self.status:
+            raise AssertionError('write() before start_response()')
+        elif not self.headers_sent:
+            self.bytes_sent = len(data)
+            self.send_headers()
+        else:
+            self.bytes_sent += len(data)
+        if self.request_handler.command == 'HEAD':
+            return
+        if self.chunked:
+            if data:
+                self._write("%x\r\n%s\r\n" % (len(data), data))
+        else:
+            self._write(data)
+        self._flush()
+
+    def finish_content(self):
+        if self.chunked and self.headers_sent:
+            self._write('0\r\n\r\n')
+            self._flush()
+        else:
+            wsgiref.simple_server.ServerHandler.finish_content(self)
+
+    def handle_error(self):
+        "The response is incomplete if sent in part; drop the connection."
+        if self.headers_sent:
+            self.request_handler.close_connection = 1
+        wsgiref.simple_server.ServerHandler.handle_error(self)
+
+    def close(self):
+        "Close the connection after the response, if it must be."
+        if not self.headers_sent or \
+           (self.headers.get('Connection') or '').lower() == 'close':
+            self.request_handler.close_connection = 1
+        wsgiref.simple_server.ServerHandler.close(self)
+
+
+class InputWrapper(object):
+    """Request body input, limited to the content length,
+    so that reading it does not consume the next request.
+    """
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.readline(size)
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=None):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line: break
+            yield line
+
+    def drain(self):
+        "Read and discard what remains of the body."
+        while self.remaining > 0:
+            if not self.read(min(self.remaining, 65536)): break
+
+
+class RequestHandler(wsgiref.simple_server.WSGIRequestHandler):
+    "Handle the requests of a connection, while kept alive."
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        self.timeout = self.server.keepalive
+        wsgiref.simple_server.WSGIRequestHandler.setup(self)
+
+    def handle(self):
+        self.close_connection = 1
+        self.handle_one_request()
+        while not self.close_connection and not self.server.stopping:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            self.close_connection = 1
+            return
+        if not self.raw_requestline:
+            self.close_connection = 1
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            self.close_connection = 1
+            return
+        if not self.parse_request():    # An error code has been sent
+            self.close_connection = 1
+            return
+        if self.headers.get('Transfer-Encoding', 'identity') != 'identity':
+            self.send_error(411)        # Chunked request body not supported
+            self.close_connection = 1
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.send_error(400, 'Invalid Content-Length')
+            self.close_connection = 1
+            return
+        input = InputWrapper(self.rfile, length)
+        handler = ServerHandler(input, self.wfile, self.get_stderr(),
+                                self.get_environ(),
+                                multithread=True, multiprocess=True)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+        if not self.close_connection:
+            input.drain()
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s", self.client_address[0], format % args)
+
+
+class ThreadPoolServer(wsgiref.simple_server.WSGIServer):
+    """WSGI server using an existing listening socket, handling
+    the connections by a fixed-size pool of threads.
+    """
+
+    timeout = 0.5                       # Seconds; check for stopping
+
+    def __init__(self, sock, application, threads=10, keepalive=5.0):
+        SocketServer.TCPServer.__init__(self, sock.getsockname(),
+                                        RequestHandler,
+                                        bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(application)
+        self.keepalive = keepalive
+        self.stopping = False
+        self.queue = Queue.Queue(threads * 4)
+        self.threads = []
+        for i in xrange(threads):
+            thread = threading.Thread(target=self.work)
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+
+    def process_request(self, request, client_address):
+        "Queue the connection for a thread in the pool."
+        self.queue.put((request, client_address))
+
+    def work(self):
+        "Handle connections from the queue, until given None."
+        while True:
+            item = self.queue.get()
+            if item is None: return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            self.close_request(request)
+
+    def serve_until_stopped(self):
+        "Handle connections until stopped; then wait for the threads."
+        while not self.stopping:
+            try:
+                self.handle_request()
+            except (select.error, socket.error), error:
+                if error.args[0] != errno.EINTR: raise
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def handle_timeout(self):
+        pass
+
+
+def get_socket(host, port, reuseport=False, backlog=128):
+    "Return a listening socket."
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def load_application(spec):
+    "Import and return the application given as 'module:name'."
+    module, sep, name = spec.partition(':')
+    name = name or 'application'
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    __import__(module)
+    return getattr(sys.modules[module], name)
+
+
+class Master(object):
+    "Fork and supervise the worker processes."
+
+    def __init__(self, spec, host='127.0.0.1', port=8000,
+                 workers=2, threads=10, keepalive=5.0, reuseport=True):
+        self.spec = spec
+        self.host = host
+        self.port = port
+        self.nworkers = workers
+        self.threads = threads
+        self.keepalive = keepalive
+        self.reuseport = reuseport and SO_REUSEPORT is not None
+        if self.reuseport:
+            self.socket = None
+        else:
+            self.socket = get_socket(host, port)
+        self.workers = set()
+        self.stopping = False
+        self.restarting = False
+
+    def run(self):
+        "Start the workers, and supervise them until stopped."
+        signal.signal(signal.SIGHUP, self.on_restart)
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+        logging.info("wrapid: serving %s on http://%s:%s/ with %s workers"
+                     " of %s threads", self.spec, self.host, self.port,
+                     self.nworkers, self.threads)
+        self.spawn_workers()
+        while True:
+            if self.stopping:
+                self.signal_workers(self.workers, signal.SIGTERM)
+                self.wait_workers()
+                return
+            if self.restarting:
+                self.restarting = False
+                old = set(self.workers)
+                self.spawn_workers()
+                self.signal_workers(old, signal.SIGTERM)
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except OSError, error:
+                if error.errno == errno.EINTR: continue
+                if error.errno == errno.ECHILD:
+                    time.sleep(0.1)
+                    continue
+                raise
+            if pid in self.workers:
+                self.workers.discard(pid)
+                if not self.stopping and \
+                   len(self.workers) < self.nworkers and status != 0:
+                    logging.warning("wrapid: worker %s died; respawning", pid)
+                    time.sleep(0.5)
+                    self.spawn_worker()
+
+    def on_restart(self, signum, frame):
+        self.restarting = True
+
+    def on_stop(self, signum, frame):
+        self.stopping = True
+
+    def spawn_workers(self):
+        for i in xrange(self.nworkers):
+            self.spawn_worker()
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers.add(pid)
+            return
+        # In the child process.
+        status = 0
+        try:
+            self.run_worker()
+        except Exception:
+            logging.exception('wrapid: worker failed')
+            status = 1
+        os._exit(status)
+
+    def run_worker(self):
+        "Run in the worker process: import the application and serve."
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        sock = self.socket or get_socket(self.host, self.port, reuseport=True)
+        server = ThreadPoolServer(sock, load_application(self.spec),
+                                  threads=self.threads,
+                                  keepalive=self.keepalive)
+        def stop(signum, frame):
+            server.stopping = True
+        signal.signal(signal.SIGTERM, stop)
+        server.serve_until_stopped()
+
+    def signal_workers(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+
+    def wait_workers(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except OSError, error:
+                if error.errno == errno.EINTR: continue
+                break
+            self.workers.discard(pid)
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] module:application')
+    parser.add_option('--host', '-H', action='store', default='127.0.0.1')
+    parser.add_option('--port', '-p', action='store', type='int', default=8000)
+    parser.add_option('--workers', '-w', action='store', type='int',
+                      default=2, help='number of worker processes')
+    parser.add_option('--threads', '-t', action='store', type='int',
+                      default=10, help='number of threads per worker')
+    parser.add_option('--keepalive', '-k', action='store', type='float',
+                      default=5.0, help='seconds to keep idle connection')
+    parser.add_option('--no-reuseport', action='store_false',
+                      dest='reuseport', default=True,
+                      help='share the socket of the master process'
+                      ' instead of using SO_REUSEPORT')
+    options, arguments = parser.parse_args()
+    if len(arguments) != 1:
+        parser.error('specify the application as module:application')
+    logging.basicConfig(level=logging.INFO)
+    master = Master(arguments[0],
+                    host=options.host,
+                    port=options.port,
+                    workers=options.workers,
+                    threads=options.threads,
+                    keepalive=options.keepalive,
+                    reuseport=options.reuseport)
+    master.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 """ wrapid: Micro framework built on Python WSGI for RESTful server APIs
 
-Text representation using Python 'pprint'.
+Text representation: the data formatted as a Python literal.
 """
 
 import pprint
@@ -10,13 +10,110 @@ from .utils import rstr
 
 
 class TextRepresentation(Representation):
-    "Text representation of the resource using Python 'pprint'."
+    """Text representation of the resource: the data formatted as
+    a Python literal, which can be read back using 'eval'.
+    """
 
     mimetype = 'text/plain'
     charset = 'utf-8'
     format = 'txt'
+    width = 80
 
     def __call__(self, data):
         response = HTTP_OK(**self.get_http_headers())
-        response.append(pprint.pformat(rstr(data), indent=2))
+        response.append(pformat(data, width=self.width))
         return response
+
+
+SCALAR_TYPES = set([str, int, long, float, bool, type(None)])
+
+CONTAINERS = {dict: ('{', '}'),
+              list: ('[', ']'),
+              tuple: ('(', ')'),
+              set: ('set([', '])'),
+              frozenset: ('frozenset([', '])')}
+
+
+def pformat(value, width=80):
+    """Return the value formatted as a Python literal, in the layout
+    of 'pprint' with indent 2. Unicode strings are encoded using UTF-8,
+    also when sorting the keys of dictionaries and the items of sets.
+    Unlike 'pprint', the value is formatted in a single pass: a container
+    is written on one line only if all its items are scalars and it fits
+    within the width, else one item per line. Values of other types than
+    the built-in scalars and containers are formatted by 'pprint'.
+    """
+    chunks = []
+    format_value(value, chunks.append, 0, width)
+    return ''.join(chunks)
+
+def format_scalar(value):
+    """Return the repr of the scalar value, or of the empty container,
+    else None.
+    """
+    if type(value) is unicode:
+        return repr(value.encode('utf-8', 'ignore'))
+    elif type(value) in SCALAR_TYPES:
+        return repr(value)
+    elif not value and type(value) in CONTAINERS:
+        return ''.join(CONTAINERS[type(value)])
+    else:
+        return None
+
+def format_value(value, write, column, width):
+    """Write the formatted value, which starts at the given column.
+    Containers are written recursively.
+    """
+    text = format_scalar(value)
+    if text is not None:
+        write(text)
+        return
+    try:
+        start, end = CONTAINERS[type(value)]
+    except KeyError:
+        text = pprint.pformat(rstr(value), indent=2,
+                              width=max(width - column, 20))
+        write(text.replace('\n', '\n' + ' ' * column))
+        return
+    if type(value) is dict:
+        items = sorted(value.iteritems(), key=lambda item: rstr(item[0]))
+        keys = [format_scalar(k) or repr(rstr(k)) for k, v in items]
+        items = [v for k, v in items]
+    else:
+        if type(value) in (set, frozenset):
+            items = sorted(value, key=rstr)
+        else:
+            items = value
+        keys = None
+    if len(items) == 1 and type(value) is tuple:
+        end = ',)'
+    # On one line, if all items are scalars and it fits.
+    texts = map(format_scalar, items)
+    if None not in texts:
+        if keys is None:
+            parts = texts
+        else:
+            parts = ["%s: %s" % kt for kt in zip(keys, texts)]
+        line = start + ', '.join(parts) + end
+        if column + len(line) <= width:
+            write(line)
+            return
+    # Else one item per line.
+    write(start + ' ')
+    column += len(start) + 1
+    separator = ",\n" + ' ' * column
+    for pos, item in enumerate(items):
+        if pos:
+            write(separator)
+        if keys is None:
+            offset = column
+        else:
+            write(keys[pos])
+            write(': ')
+            offset = column + len(keys[pos]) + 2
+        text = texts[pos]
+        if text is None:
+            format_value(item, write, offset, width)
+        else:
+            write(text)
+    write(end)
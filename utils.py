@@ -7,6 +7,8 @@ import time
 import urllib
 import urlparse
 import unicodedata
+import threading
+from timeit import default_timer as timer  # Best high-resolution timer
 
 
 HTTP_METHODS = ['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'HEAD']
@@ -99,6 +101,135 @@ def url_build(*segments, **query):
         return url
 
 
+
+class cached_property(object):
+    """Decorator for a property computed on first access. The value is
+    stored in the instance, where it hides the property thereafter,
+    and may be assigned to.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.__name__ = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None: return self
+        value = instance.__dict__[self.__name__] = self.function(instance)
+        return value
+
+
+class LruCache(object):
+    """Mapping bounded in size, discarding the least recently used item
+    when full. Counts the hits and misses of lookups. Thread-safe.
+    The items are kept in a circular doubly linked list, most recently
+    used last, of links [previous, next, key, value].
+    """
+
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize):
+        assert maxsize > 0
+        self.maxsize = maxsize
+        self.links = dict()
+        self.root = []
+        self.root[:] = [self.root, self.root, None, None]
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.links)
+
+    def __contains__(self, key):
+        return key in self.links
+
+    def __getitem__(self, key):
+        "Return the value, marking it as recently used. Counts hit or miss."
+        with self.lock:
+            try:
+                link = self.links[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self._unlink(link)
+            self._append(link)
+            self.hits += 1
+            return link[self.VALUE]
+
+    def __setitem__(self, key, value):
+        "Set the value, discarding the least recently used item if full."
+        with self.lock:
+            try:
+                self._unlink(self.links.pop(key))
+            except KeyError:
+                pass
+            link = [None, None, key, value]
+            self.links[key] = link
+            self._append(link)
+            while len(self.links) > self.maxsize:
+                self._popitem()
+
+    def __delitem__(self, key):
+        with self.lock:
+            self._unlink(self.links.pop(key))
+
+    def peek(self, key):
+        """Return the value without marking it as recently used,
+        and without counting a hit or miss. Raise KeyError if none.
+        """
+        return self.links[key][self.VALUE]
+
+    def keys(self):
+        "Return the keys, least recently used first."
+        with self.lock:
+            result = []
+            link = self.root[self.NEXT]
+            while link is not self.root:
+                result.append(link[self.KEY])
+                link = link[self.NEXT]
+            return result
+
+    def popitem(self):
+        """Remove and return the least recently used (key, value).
+        Raise KeyError if empty.
+        """
+        with self.lock:
+            return self._popitem()
+
+    def clear(self):
+        "Remove all items. The counts of hits and misses are kept."
+        with self.lock:
+            self.links.clear()
+            self.root[:] = [self.root, self.root, None, None]
+
+    def get_stats(self):
+        "Return a dictionary with the size, hits and misses."
+        return dict(size=len(self.links),
+                    maxsize=self.maxsize,
+                    hits=self.hits,
+                    misses=self.misses)
+
+    def _popitem(self):
+        link = self.root[self.NEXT]
+        if link is self.root:
+            raise KeyError('cache is empty')
+        self._unlink(link)
+        del self.links[link[self.KEY]]
+        return (link[self.KEY], link[self.VALUE])
+
+    def _unlink(self, link):
+        link[self.PREV][self.NEXT] = link[self.NEXT]
+        link[self.NEXT][self.PREV] = link[self.PREV]
+
+    def _append(self, link):
+        last = self.root[self.PREV]
+        link[self.PREV] = last
+        link[self.NEXT] = self.root
+        last[self.NEXT] = link
+        self.root[self.PREV] = link
+
+
 if __name__ == '__main__':
     print now()
     print now_date()
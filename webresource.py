@@ -8,9 +8,10 @@ import httplib
 import urllib
 import base64
 import wsgiref.headers
-import json
 import copy
 
+from . import jsoncodec
+
 
 class Webresource(object):
     "Interface to a web resource."
@@ -107,7 +108,7 @@ class Webresource(object):
         """
         if data:
             if content_type == 'application/json':
-                body = json.dumps(data)
+                body = jsoncodec.dumps(data)
             else:
                 body = data
             headers = self.get_headers(content_type=content_type)
@@ -124,7 +125,7 @@ class Webresource(object):
         """
         if data:
             if content_type == 'application/json':
-                body = json.dumps(data)
+                body = jsoncodec.dumps(data)
             else:
                 body = data
             headers = self.get_headers(content_type=content_type)
@@ -1,27 +1,91 @@
 """ wrapid: Micro framework built on Python WSGI for RESTful server APIs
 
-Base class for standard XML representation using ElementTree.
+Base class for standard XML representation.
 """
 
 import xml.etree.ElementTree
+from xml.sax.saxutils import escape
 
 from wrapid.representation import *
 
 
 class XmlRepresentation(Representation):
-    "XML representation of the resource using ElementTree.TreeBuilder."
+    """XML representation of the resource. The data is written element
+    by element, without building a tree of the entire document.
+
+    If 'streaming' is True, or if any entry in the data dictionary
+    is a generator or other iterator, then the body is produced while
+    it is being sent, in chunks of about 'buffer_size' bytes, and no
+    ETag is computed. Otherwise the document is produced in full
+    before the response is sent.
+
+    A dictionary becomes elements named by its keys, in sorted order
+    if 'sort_keys' is True, and a list, tuple or other iterator becomes
+    elements named 'item'. The root element is named 'data'.
+    """
 
     mimetype = 'application/xml'
     charset = 'utf-8'
     format = 'xml'
+    streaming = False
+    sort_keys = True
 
     def __call__(self, data):
         response = HTTP_OK(**self.get_http_headers())
-        element = self.data_to_element(data)
-        response.append('<?xml version="1.0" encoding="%s"?>' % self.charset)
-        response.append(xml.etree.ElementTree.tostring(element, self.charset))
+        chunks = self.iterencode(data)
+        if self.streaming or self.has_iterator(data):
+            response.buffered = False
+            response.content = self.coalesce(chunks)
+        else:
+            response.append(''.join(chunks))
         return response
 
+    def iterencode(self, data):
+        "Yield the chunks of the XML document for the data."
+        yield '<?xml version="1.0" encoding="%s"?>' % self.charset
+        for chunk in self.iterencode_element('data', data):
+            yield chunk
+
+    def iterencode_element(self, name, item):
+        """Yield the chunks of the element of the given name for the item.
+        An element without content is written as an empty-element tag.
+        """
+        name = name.encode(self.charset)
+        if isinstance(item, (dict, tuple, list)) or is_iterator(item):
+            chunks = self.iterencode_content(item)
+            for chunk in chunks:
+                if chunk: break
+            else:
+                yield "<%s />" % name
+                return
+            yield "<%s>" % name
+            yield chunk
+            for chunk in chunks:
+                yield chunk
+            yield "</%s>" % name
+        else:
+            text = escape(unicode(item)).encode(self.charset,
+                                                'xmlcharrefreplace')
+            if text:
+                yield "<%s>%s</%s>" % (name, text, name)
+            else:
+                yield "<%s />" % name
+
+    def iterencode_content(self, item):
+        "Yield the chunks of the elements contained in the item."
+        if isinstance(item, dict):
+            if self.sort_keys:
+                keys = sorted(item.keys())
+            else:
+                keys = item.iterkeys()
+            for key in keys:
+                for chunk in self.iterencode_element(key, item[key]):
+                    yield chunk
+        else:
+            for part in item:
+                for chunk in self.iterencode_element('item', part):
+                    yield chunk
+
     def data_to_element(self, data):
         "Return an ElementTree element produced from the data dictionary."
         self.builder = xml.etree.ElementTree.TreeBuilder()